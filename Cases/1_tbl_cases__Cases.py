@@ -14,7 +14,7 @@ from datetime import datetime
 import logging
 from decimal import Decimal
 import sys
-from db_connections import get_mysql_connection, get_postgres_connection
+from db_connections import get_mysql_connection, get_postgres_connection, put_postgres_connection
 # Configure logging
 script_dir = os.path.dirname(os.path.abspath(__file__))
 log_dir = os.path.join(script_dir, 'cases_logs')
@@ -579,7 +579,7 @@ def migrate_cases():
             mysql_conn.close()
             logger.info("MySQL connection closed")
         if postgres_conn:
-            postgres_conn.close()
+            put_postgres_connection(postgres_conn)
             logger.info("PostgreSQL connection closed")
 
 def verify_migration():
@@ -625,7 +625,7 @@ def verify_migration():
         if mysql_conn:
             mysql_conn.close()
         if postgres_conn:
-            postgres_conn.close()
+            put_postgres_connection(postgres_conn)
 
 def test_invoice_mapping():
     """Test function to verify invoice mapping is working correctly"""
@@ -815,7 +815,7 @@ def test_clinic_location_mapping():
         logger.error(f"Full traceback: {traceback.format_exc()}")
     finally:
         if postgres_conn:
-            postgres_conn.close()
+            put_postgres_connection(postgres_conn)
 
 def get_clinic_location_mapping(postgres_cursor):
     """
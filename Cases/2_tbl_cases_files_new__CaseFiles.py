@@ -16,7 +16,7 @@ from datetime import datetime
 
 # Add parent directory to path to import db_connections
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_connections import get_mysql_connection, get_postgres_connection
+from db_connections import get_mysql_connection, get_postgres_connection, put_postgres_connection
 
 colorama.init(autoreset=True)
 
@@ -385,7 +385,7 @@ def migrate_data():
             mysql_conn.close()
             logger.info("MySQL connection closed")
         if postgres_conn:
-            postgres_conn.close()
+            put_postgres_connection(postgres_conn)
             logger.info("PostgreSQL connection closed")
 
 if __name__ == "__main__":
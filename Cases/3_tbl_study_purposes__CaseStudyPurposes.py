@@ -10,7 +10,7 @@ from datetime import datetime
 
 # Add parent directory to path to import db_connections
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_connections import get_mysql_connection, get_postgres_connection
+from db_connections import get_mysql_connection, get_postgres_connection, put_postgres_connection
 
 # Create cases_logs directory if it doesn't exist
 log_dir = 'cases_logs'
@@ -256,7 +256,7 @@ def migrate_study_purposes():
             mysql_conn.close()
             logger.info("MySQL connection closed")
         if postgres_conn:
-            postgres_conn.close()
+            put_postgres_connection(postgres_conn)
             logger.info("PostgreSQL connection closed")
 
 def verify_migration():
@@ -292,7 +292,7 @@ def verify_migration():
             logger.warning(f"⚠️ Verification WARNING: Counts don't match (difference: {abs(unique_source_cases - target_count)})")
         
         mysql_conn.close()
-        postgres_conn.close()
+        put_postgres_connection(postgres_conn)
         
     except Exception as e:
         logger.error(f"Error during verification: {str(e)}")
@@ -23,7 +23,7 @@ import argparse
 
 # Add the parent directory to Python path to import db_connections
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_connections import get_mysql_connection, get_postgres_connection
+from db_connections import get_mysql_connection, get_postgres_connection, put_postgres_connection
 
 # Create cases_logs directory if it doesn't exist
 log_dir = 'cases_logs'
@@ -104,7 +104,7 @@ class CasesToCasePatientsDataMigrator:
         if self.mysql_conn:
             self.mysql_conn.close()
         if self.postgres_conn:
-            self.postgres_conn.close()
+            put_postgres_connection(self.postgres_conn)
         logger.info("Database connections closed")
 
     # --- REMOVED: remove_foreign_key_constraints and drop_not_null_on_clinicpatients_clinicid ---
@@ -15,7 +15,7 @@ import os
 
 # Add parent directory to path to import db_connections
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_connections import get_mysql_connection, get_postgres_connection
+from db_connections import get_mysql_connection, get_postgres_connection, put_postgres_connection
 
 # Create cases_logs directory if it doesn't exist
 log_dir = 'cases_logs'
@@ -355,7 +355,7 @@ def debug_mapping_analysis():
         if mysql_conn:
             mysql_conn.close()
         if postgres_conn:
-            postgres_conn.close()
+            put_postgres_connection(postgres_conn)
 
 def remove_caseservices_constraints(postgres_conn):
     """Remove all NOT NULL and foreign key constraints from CaseServices table."""
@@ -629,7 +629,7 @@ def migrate_case_services():
             mysql_conn.close()
             logger.info("MySQL connection closed")
         if postgres_conn:
-            postgres_conn.close()
+            put_postgres_connection(postgres_conn)
             logger.info("PostgreSQL connection closed")
 
 def verify_migration():
@@ -688,7 +688,7 @@ def verify_migration():
         if mysql_conn:
             mysql_conn.close()
         if postgres_conn:
-            postgres_conn.close()
+            put_postgres_connection(postgres_conn)
 
 def update_master_services_table():
     """Update MasterServices table to set all isDeleted values to false"""
@@ -745,7 +745,7 @@ def update_master_services_table():
         
     finally:
         if postgres_conn:
-            postgres_conn.close()
+            put_postgres_connection(postgres_conn)
 
 if __name__ == "__main__":
     logger.info("Starting CaseServices migration...")
@@ -26,7 +26,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 script_dir = os.path.dirname(os.path.abspath(__file__))
 log_dir = os.path.join(script_dir, 'clinic_logs')
 os.makedirs(log_dir, exist_ok=True)
-from db_connections import get_mysql_connection, get_postgres_connection
+from db_connections import get_mysql_connection, get_postgres_connection, put_postgres_connection
 
 # Configure logging
 logging.basicConfig(
@@ -76,7 +76,7 @@ class PracticeToClinicsDataMigrator:
         if self.mysql_conn:
             self.mysql_conn.close()
         if self.postgres_conn:
-            self.postgres_conn.close()
+            put_postgres_connection(self.postgres_conn)
         logger.info("Database connections closed")
 
     def convert_status(self, mysql_status: str) -> str:
@@ -15,7 +15,7 @@ import mysql.connector
 import psycopg2
 from datetime import datetime
 import logging
-from db_connections import get_mysql_connection, get_postgres_connection
+from db_connections import get_mysql_connection, get_postgres_connection, put_postgres_connection
 
 # Configure logging
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -362,7 +362,7 @@ def main():
         if 'postgres_cursor' in locals():
             postgres_cursor.close()
         if postgres_conn:
-            postgres_conn.close()
+            put_postgres_connection(postgres_conn)
             logger.info("PostgreSQL connection closed")
 
 if __name__ == "__main__":
@@ -16,7 +16,7 @@ from typing import List, Dict, Any
 
 # Add parent directory to path to import db_connections
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_connections import get_mysql_connection, get_postgres_connection
+from db_connections import get_mysql_connection, get_postgres_connection, put_postgres_connection
 
 # Create invoice_log directory if it doesn't exist
 log_dir = 'invoice_logs'
@@ -66,7 +66,7 @@ class DatabaseMigrator:
             self.mysql_conn.close()
             logger.info("MySQL connection closed")
         if self.postgres_conn:
-            self.postgres_conn.close()
+            put_postgres_connection(self.postgres_conn)
             logger.info("PostgreSQL connection closed")
     
     def prepare_table_for_migration(self):
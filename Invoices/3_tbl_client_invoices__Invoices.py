@@ -14,7 +14,7 @@ from datetime import datetime
 
 # Add parent directory to path to import db_connections
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_connections import get_mysql_connection, get_postgres_connection
+from db_connections import get_mysql_connection, get_postgres_connection, put_postgres_connection
 
 # Setup logging directory relative to script location
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -554,7 +554,7 @@ class InvoiceMigration:
             if self.postgres_cursor:
                 self.postgres_cursor.close()
             if self.postgres_conn:
-                self.postgres_conn.close()
+                put_postgres_connection(self.postgres_conn)
                 logger.info("PostgreSQL connection closed")
                 
         except Exception as e:
@@ -21,73 +21,217 @@ Usage:
 
 import sys
 import os
+import json
 import logging
+import logging.handlers
 from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from psycopg2.extras import execute_values
+from tqdm import tqdm
 
 # Add parent directory to path to import db_connections
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_connections import get_mysql_connection, get_postgres_connection
+from db_connections import get_mysql_connection, get_postgres_connection, put_postgres_connection
 
 # Create invoice_logs directory if it doesn't exist
 log_dir = 'invoice_logs'
 if not os.path.exists(log_dir):
     os.makedirs(log_dir)
 
-# Configure logging
+# Configure logging (file writes are buffered and flushed every 1024 records
+# or immediately on errors)
 log_filename = os.path.join(log_dir, '4_tbl_client_invoice_details_&_tbl_client_invoice_reports__InvoiceCaseServices.log')
+file_handler = logging.FileHandler(log_filename)
+file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler(log_filename),
+        logging.handlers.MemoryHandler(1024, flushLevel=logging.ERROR, target=file_handler),
         logging.StreamHandler(sys.stdout)
     ]
 )
 logger = logging.getLogger(__name__)
 
+# Number of rows sent per execute_values call and committed together
+BATCH_SIZE = 5000
+
+# Indexes dropped for the load are recorded here until they are rebuilt, so a run
+# that is killed mid-load gets them back on the next run
+PENDING_RESTORE_FILE = os.path.join(log_dir, '4_tbl_client_invoice_details_&_tbl_client_invoice_reports__InvoiceCaseServices.pending_restore.json')
+
+# PostgreSQL numeric(10,2) can handle values up to 99,999,999.99
+MAX_AMOUNT = Decimal('99999999.99')
+MIN_AMOUNT = Decimal('-99999999.99')
+ZERO_AMOUNT = Decimal('0.00')
+CENT = Decimal('0.01')
+
 class MigrationError(Exception):
     """Custom exception for migration errors"""
     pass
 
-def validate_foreign_keys(postgres_cursor, invoice_id, case_id):
+def get_existing_ids(postgres_conn, table, column):
+    """
+    Load every id of a parent table once, so foreign keys are checked in memory
+    instead of with one query per row (parent tables are not modified during the run)
+    
+    Args:
+        postgres_conn: PostgreSQL connection
+        table: Parent table name
+        column: Primary key column name
+    
+    Returns:
+        set: Existing ids
+    """
+    try:
+        # Server-side cursor so the ids are pulled in chunks, not all at once
+        with postgres_conn.cursor(name=f'{table}_ids') as cur:
+            cur.itersize = 10000
+            cur.execute(f'SELECT "{column}" FROM "{table}"')
+            return set(row[0] for row in cur)
+    except Exception as e:
+        logger.error(f"Error loading {table} ids: {e}")
+        raise MigrationError(f"Failed to load {table} ids: {e}")
+
+def validate_foreign_keys(valid_invoice_ids, valid_case_ids, invoice_id, case_id):
     """
     Validate that invoice_id and case_id exist in their respective parent tables.
     
     Args:
-        postgres_cursor: PostgreSQL cursor
+        valid_invoice_ids: Set of existing Invoices.iId
+        valid_case_ids: Set of existing Cases.cId
         invoice_id: Invoice ID to validate
         case_id: Case ID to validate
     
     Returns:
         tuple: (invoice_exists, case_exists)
     """
+    return invoice_id in valid_invoice_ids, case_id in valid_case_ids
+
+def drop_secondary_indexes(postgres_cursor):
+    """
+    Drop all non-primary-key indexes on InvoiceCaseServices so the bulk load
+    does not pay per-row B-tree maintenance. The definitions are returned so
+    they can be rebuilt in a single pass once the load is done.
+    
+    Args:
+        postgres_cursor: PostgreSQL cursor
+    
+    Returns:
+        list: List of (index_name, index_definition) tuples that were dropped
+    """
     try:
-        # Check if invoice exists
-        postgres_cursor.execute('SELECT COUNT(*) FROM "Invoices" WHERE "iId" = %s', (invoice_id,))
-        invoice_exists = postgres_cursor.fetchone()[0] > 0
+        postgres_cursor.execute("""
+            SELECT i.indexname, i.indexdef
+            FROM pg_indexes i
+            WHERE i.schemaname = 'public'
+              AND i.tablename = 'InvoiceCaseServices'
+              AND NOT EXISTS (
+                  SELECT 1 FROM pg_constraint c
+                  WHERE c.conrelid = '"InvoiceCaseServices"'::regclass
+                    AND c.conname = i.indexname
+                    AND c.contype IN ('p', 'u')
+              )
+        """)
+        indexes = postgres_cursor.fetchall()
         
-        # Check if case exists
-        postgres_cursor.execute('SELECT COUNT(*) FROM "Cases" WHERE "cId" = %s', (case_id,))
-        case_exists = postgres_cursor.fetchone()[0] > 0
+        for index_name, _ in indexes:
+            postgres_cursor.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+            logger.info(f"Dropped index {index_name} for bulk load")
         
-        return invoice_exists, case_exists
+        return indexes
         
     except Exception as e:
-        logger.error(f"Error validating foreign keys: {e}")
-        raise MigrationError(f"Failed to validate foreign keys: {e}")
+        logger.error(f"Error dropping secondary indexes: {e}")
+        raise MigrationError(f"Failed to drop secondary indexes: {e}")
+
+def recreate_indexes(postgres_cursor, indexes):
+    """
+    Rebuild the indexes dropped by drop_secondary_indexes. Safe to re-run after a
+    partial rebuild; indexes that already exist are kept.
+    
+    Args:
+        postgres_cursor: PostgreSQL cursor
+        indexes: List of (index_name, index_definition) tuples
+    """
+    try:
+        for index_name, index_definition in indexes:
+            # indexdef is "CREATE [UNIQUE] INDEX <name> ON ..."
+            postgres_cursor.execute(index_definition.replace(" INDEX ", " INDEX IF NOT EXISTS ", 1))
+            logger.info(f"Rebuilt index {index_name}")
+    except Exception as e:
+        logger.error(f"Error rebuilding indexes: {e}")
+        raise MigrationError(f"Failed to rebuild indexes: {e}")
+
+def save_pending_restore(indexes):
+    """Record dropped indexes until recreate_indexes has committed"""
+    with open(PENDING_RESTORE_FILE, 'w') as f:
+        json.dump(indexes, f)
+
+def load_pending_restore():
+    """
+    Returns:
+        list: (index_name, index_definition) pairs left dropped by an interrupted run
+    """
+    if not os.path.exists(PENDING_RESTORE_FILE):
+        return []
+    with open(PENDING_RESTORE_FILE) as f:
+        return json.load(f)
 
-def get_source_data(mysql_cursor):
+def clear_pending_restore():
+    if os.path.exists(PENDING_RESTORE_FILE):
+        os.remove(PENDING_RESTORE_FILE)
+
+def advance_ics_id_sequence(postgres_cursor):
     """
-    Fetch data from MySQL tables with JOIN
+    Move the icsId sequence past the migrated ids (inserted explicitly from the
+    source report id), so application inserts get fresh keys
+    
+    Args:
+        postgres_cursor: PostgreSQL cursor
+    """
+    postgres_cursor.execute('''
+        SELECT setval(pg_get_serial_sequence('"InvoiceCaseServices"', 'icsId'),
+                      COALESCE(MAX("icsId"), 0) + 1, false)
+        FROM "InvoiceCaseServices"
+    ''')
+
+def count_source_data(mysql_cursor):
+    """
+    Count the rows returned by the source JOIN
     
     Args:
         mysql_cursor: MySQL cursor
     
     Returns:
-        list: List of tuples containing joined data
+        int: Number of source records
+    """
+    try:
+        mysql_cursor.execute("""
+            SELECT COUNT(*)
+            FROM tbl_client_invoice_details d
+            INNER JOIN tbl_client_invoice_reports r ON d.id = r.client_invoice_details_id
+        """)
+        return mysql_cursor.fetchone()[0]
+    except Exception as e:
+        logger.error(f"Error counting source data: {e}")
+        raise MigrationError(f"Failed to count source data: {e}")
+
+def iter_source_data(mysql_cursor, batch_size=BATCH_SIZE):
+    """
+    Stream data from MySQL tables with JOIN, one batch at a time, so only
+    batch_size source rows are held in memory
+    
+    Args:
+        mysql_cursor: MySQL cursor (unbuffered)
+        batch_size: Number of rows fetched per round-trip
+    
+    Yields:
+        tuple: Joined source row
     """
     query = """
     SELECT 
+        r.id,
         d.client_invoice_id,
         d.case_id,
         d.total_amount,
@@ -100,7 +244,11 @@ def get_source_data(mysql_cursor):
     
     try:
         mysql_cursor.execute(query)
-        return mysql_cursor.fetchall()
+        while True:
+            rows = mysql_cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
     except Exception as e:
         logger.error(f"Error fetching source data: {e}")
         raise MigrationError(f"Failed to fetch source data: {e}")
@@ -116,43 +264,42 @@ def validate_and_sanitize_amount(amount, record_id=None):
     Returns:
         tuple: (sanitized_amount, is_valid, warning_message)
     """
+    # amount and rushFee are NOT NULL; reject here so the row is skipped before batching
     if amount is None:
-        return None, True, None
+        return None, False, "Missing amount value"
     
     try:
-        # Convert to float for validation
-        amount_float = float(amount)
+        # MySQL DECIMAL columns already arrive as Decimal; keep them exact
+        amount_decimal = amount if isinstance(amount, Decimal) else Decimal(str(amount))
         
         # Check for invalid values (NaN, infinity, etc.)
-        if not (amount_float == amount_float and amount_float != float('inf') and amount_float != float('-inf')):
+        if not amount_decimal.is_finite():
             return None, False, f"Invalid amount value: {amount}"
         
-        # PostgreSQL numeric(10,2) can handle values up to 99,999,999.99
-        MAX_AMOUNT = 99999999.99
-        MIN_AMOUNT = -99999999.99
-        
-        if amount_float > MAX_AMOUNT:
-            logger.warning(f"Record {record_id}: Amount {amount} exceeds maximum allowed value, capping at {MAX_AMOUNT}")
+        if amount_decimal > MAX_AMOUNT:
+            logger.warning("Record %s: Amount %s exceeds maximum allowed value, capping at %s", record_id, amount, MAX_AMOUNT)
             return MAX_AMOUNT, True, f"Amount capped from {amount} to {MAX_AMOUNT}"
         
-        if amount_float < MIN_AMOUNT:
-            logger.warning(f"Record {record_id}: Amount {amount} below minimum allowed value, capping at {MIN_AMOUNT}")
+        if amount_decimal < MIN_AMOUNT:
+            logger.warning("Record %s: Amount %s below minimum allowed value, capping at %s", record_id, amount, MIN_AMOUNT)
             return MIN_AMOUNT, True, f"Amount capped from {amount} to {MIN_AMOUNT}"
         
-        # Round to 2 decimal places to match PostgreSQL precision
-        sanitized_amount = round(amount_float, 2)
+        # Round to 2 decimal places the same way PostgreSQL numeric does
+        sanitized_amount = amount_decimal.quantize(CENT, rounding=ROUND_HALF_UP)
         return sanitized_amount, True, None
         
-    except (ValueError, TypeError, OverflowError) as e:
+    except (InvalidOperation, ValueError, TypeError) as e:
         return None, False, f"Amount validation error: {e}"
 
-def insert_invoice_case_service(postgres_cursor, invoice_id, case_id, amount, rush_fee, created_at, record_id=None):
+def prepare_invoice_case_service(valid_invoice_ids, valid_case_ids, ics_id, invoice_id, case_id, amount, rush_fee, created_at, record_id=None):
     """
-    Insert a single record into InvoiceCaseServices table
+    Build the insert values for a single InvoiceCaseServices record
     Foreign key validation is performed to ensure data integrity.
     
     Args:
-        postgres_cursor: PostgreSQL cursor
+        valid_invoice_ids: Set of existing Invoices.iId
+        valid_case_ids: Set of existing Cases.cId
+        ics_id: Source report id, used as icsId so re-runs can skip migrated rows
         invoice_id: Invoice ID
         case_id: Case ID
         amount: Total amount
@@ -161,45 +308,39 @@ def insert_invoice_case_service(postgres_cursor, invoice_id, case_id, amount, ru
         record_id: Record identifier for logging
     
     Returns:
-        int: ID of inserted record
+        tuple: Values ready to be inserted by insert_batch
     """
     # Validate foreign key relationships
-    invoice_exists, case_exists = validate_foreign_keys(postgres_cursor, invoice_id, case_id)
+    invoice_exists, case_exists = validate_foreign_keys(valid_invoice_ids, valid_case_ids, invoice_id, case_id)
     
     if not invoice_exists:
-        logger.warning(f"Record {record_id}: Invoice ID {invoice_id} does not exist in Invoices table - skipping")
+        logger.warning("Record %s: Invoice ID %s does not exist in Invoices table - skipping", record_id, invoice_id)
         raise MigrationError(f"Invoice ID {invoice_id} not found in Invoices table")
     
     if not case_exists:
-        logger.warning(f"Record {record_id}: Case ID {case_id} does not exist in Cases table - skipping")
+        logger.warning("Record %s: Case ID %s does not exist in Cases table - skipping", record_id, case_id)
         raise MigrationError(f"Case ID {case_id} not found in Cases table")
     
     # Validate and sanitize amount
     sanitized_amount, amount_valid, amount_warning = validate_and_sanitize_amount(amount, record_id)
     if not amount_valid:
-        logger.error(f"Record {record_id}: Skipping due to invalid amount - {amount_warning}")
+        logger.error("Record %s: Skipping due to invalid amount - %s", record_id, amount_warning)
         raise MigrationError(f"Invalid amount: {amount_warning}")
     
     if amount_warning:
-        logger.warning(f"Record {record_id}: {amount_warning}")
+        logger.warning("Record %s: %s", record_id, amount_warning)
     
     # Validate and sanitize rush_fee
-    sanitized_rush_fee, rush_fee_valid, rush_fee_warning = validate_and_sanitize_amount(rush_fee or 0.00, record_id)
+    sanitized_rush_fee, rush_fee_valid, rush_fee_warning = validate_and_sanitize_amount(rush_fee or ZERO_AMOUNT, record_id)
     if not rush_fee_valid:
-        logger.warning(f"Record {record_id}: Invalid rush_fee, setting to 0.00 - {rush_fee_warning}")
-        sanitized_rush_fee = 0.00
+        logger.warning("Record %s: Invalid rush_fee, setting to 0.00 - %s", record_id, rush_fee_warning)
+        sanitized_rush_fee = ZERO_AMOUNT
     
     if rush_fee_warning:
-        logger.warning(f"Record {record_id}: Rush fee {rush_fee_warning}")
+        logger.warning("Record %s: Rush fee %s", record_id, rush_fee_warning)
     
-    insert_query = """
-    INSERT INTO "InvoiceCaseServices" 
-    ("invoiceId", "caseId", "amount", "rushFee", "createdAt", "isDeleted", "deletedAt", "updatedAt")
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    RETURNING "icsId"
-    """
-    
-    values = (
+    return (
+        ics_id,
         invoice_id,
         case_id,
         sanitized_amount,
@@ -209,107 +350,172 @@ def insert_invoice_case_service(postgres_cursor, invoice_id, case_id, amount, ru
         None,       # deletedAt default
         None        # updatedAt default
     )
+
+def insert_batch(postgres_cursor, batch):
+    """
+    Insert a batch of records into InvoiceCaseServices inside a savepoint; the
+    caller commits. Rows whose icsId is already present (from an earlier run)
+    are skipped. If the batch fails, it is rolled back to the savepoint and
+    retried row by row, so only the bad rows are lost.
     
+    Args:
+        postgres_cursor: PostgreSQL cursor
+        batch: List of value tuples built by prepare_invoice_case_service
+    
+    Returns:
+        tuple: (inserted, failed) record counts
+    """
+    insert_query = """
+    INSERT INTO "InvoiceCaseServices" 
+    ("icsId", "invoiceId", "caseId", "amount", "rushFee", "createdAt", "isDeleted", "deletedAt", "updatedAt")
+    VALUES %s
+    ON CONFLICT ("icsId") DO NOTHING
+    """
+    
+    postgres_cursor.execute("SAVEPOINT insert_batch")
     try:
-        postgres_cursor.execute(insert_query, values)
-        result = postgres_cursor.fetchone()
-        return result[0] if result else None
+        execute_values(postgres_cursor, insert_query, batch, page_size=len(batch))
+        postgres_cursor.execute("RELEASE SAVEPOINT insert_batch")
+        return postgres_cursor.rowcount, 0
     except Exception as e:
-        logger.error(f"Error inserting record: {e}")
-        raise MigrationError(f"Failed to insert record: {e}")
+        postgres_cursor.execute("ROLLBACK TO SAVEPOINT insert_batch")
+        logger.error("Error inserting batch of %s records, retrying row by row: %s", len(batch), e)
+    
+    inserted = 0
+    failed = 0
+    for row in batch:
+        postgres_cursor.execute("SAVEPOINT insert_row")
+        try:
+            execute_values(postgres_cursor, insert_query, [row])
+            postgres_cursor.execute("RELEASE SAVEPOINT insert_row")
+            inserted += postgres_cursor.rowcount
+        except Exception as e:
+            postgres_cursor.execute("ROLLBACK TO SAVEPOINT insert_row")
+            failed += 1
+            logger.error("Failed to insert icsId %s (invoice %s / case %s): %s", row[0], row[1], row[2], e)
+    return inserted, failed
 
-def migrate_data():
+def migrate_data(mysql_conn, postgres_conn):
     """
     Main migration function
-    """
-    mysql_conn = None
-    postgres_conn = None
     
+    Args:
+        mysql_conn: MySQL connection
+        postgres_conn: PostgreSQL connection
+    """
+    dropped_indexes = []
     try:
-        # Establish connections
-        logger.info("Establishing database connections...")
-        mysql_conn = get_mysql_connection()
-        postgres_conn = get_postgres_connection()
-        
-        mysql_cursor = mysql_conn.cursor()
+        mysql_cursor = mysql_conn.cursor(buffered=False)
         postgres_cursor = postgres_conn.cursor()
         
-        logger.info("✅ Database connections established")
         logger.info(f"Log file location: {log_filename}")
+        
+        # A previous run that was killed mid-load left its dropped indexes recorded; rebuild them first
+        dropped_indexes = load_pending_restore()
+        if dropped_indexes:
+            logger.warning("Rebuilding indexes left dropped by an interrupted run...")
+            recreate_indexes(postgres_cursor, dropped_indexes)
+            postgres_conn.commit()
+            clear_pending_restore()
+            dropped_indexes = []
         logger.info("Note: Foreign key validation will be performed to ensure data integrity")
         
-        # Get source data
-        logger.info("Fetching source data from MySQL...")
-        source_data = get_source_data(mysql_cursor)
-        logger.info(f"Found {len(source_data)} records to migrate")
+        # Count source data; the rows themselves are streamed during migration
+        logger.info("Counting source data in MySQL...")
+        total_records = count_source_data(mysql_cursor)
+        logger.info(f"Found {total_records} records to migrate")
         
-        if not source_data:
+        if not total_records:
             logger.warning("No data found to migrate")
             return
         
-        # Show sample of first 5 records
-        if source_data:
-            logger.info("=" * 60)
-            logger.info("SAMPLE DATA (First 5 records):")
-            logger.info("=" * 60)
-            for i, (invoice_id, case_id, total_amount, case_date, rush_fee) in enumerate(source_data[:5], 1):
-                logger.info(f"Record {i}: Invoice ID={invoice_id}, Case ID={case_id}, "
-                           f"Amount={total_amount}, Rush Fee={rush_fee}, Date={case_date}")
-            if len(source_data) > 5:
-                logger.info(f"... and {len(source_data) - 5} more records")
-            logger.info("=" * 60)
+        # Many source rows share the same invoice (one invoice -> many cases), so the
+        # parent ids are loaded once and foreign keys are checked in memory
+        valid_invoice_ids = get_existing_ids(postgres_conn, "Invoices", "iId")
+        valid_case_ids = get_existing_ids(postgres_conn, "Cases", "cId")
+        logger.info(f"Loaded {len(valid_invoice_ids)} invoice ids and {len(valid_case_ids)} case ids for foreign key validation")
         
         # Migration counters
-        total_records = len(source_data)
         successful_migrations = 0
         failed_migrations = 0
+        already_migrated = 0
         data_quality_issues = 0
         foreign_key_violations = 0
         
+        # The index drop is committed on its own and put back on every exit path
+        # (see finally); the dropped definitions are also kept on disk until then
+        dropped_indexes = drop_secondary_indexes(postgres_cursor)
+        save_pending_restore(dropped_indexes)
+        postgres_conn.commit()
+        
         logger.info("Starting data migration...")
         logger.info("Note: Foreign key validation will be performed - only records with valid invoiceId and caseId will be migrated")
         
-        for i, (invoice_id, case_id, total_amount, case_date, rush_fee) in enumerate(source_data, 1):
+        batch = []
+        
+        def flush_batch():
+            nonlocal successful_migrations, failed_migrations, already_migrated
+            # Each batch is its own transaction. SET LOCAL skips the WAL fsync for
+            # it only; a batch lost in a crash is re-sent by the next run.
+            postgres_cursor.execute("SET LOCAL synchronous_commit = off")
+            inserted, failed = insert_batch(postgres_cursor, batch)
+            postgres_conn.commit()
+            successful_migrations += inserted
+            failed_migrations += failed
+            already_migrated += len(batch) - inserted - failed
+            batch.clear()
+        
+        for i, (ics_id, invoice_id, case_id, total_amount, case_date, rush_fee) in enumerate(
+                tqdm(iter_source_data(mysql_cursor), total=total_records, unit="rec", disable=None), 1):
+            # Show sample of first 5 records
+            if i <= 5:
+                logger.info(f"Sample record {i}: Invoice ID={invoice_id}, Case ID={case_id}, "
+                           f"Amount={total_amount}, Rush Fee={rush_fee}, Date={case_date}")
+            
             try:
-                # Insert record (with foreign key validation)
-                inserted_id = insert_invoice_case_service(
-                    postgres_cursor, 
+                # Build record (with foreign key validation)
+                batch.append(prepare_invoice_case_service(
+                    valid_invoice_ids,
+                    valid_case_ids,
+                    ics_id,
                     invoice_id, 
                     case_id, 
                     total_amount, 
                     rush_fee,
                     case_date,
                     record_id=i
-                )
+                ))
                 
-                if inserted_id:
-                    successful_migrations += 1
-                    if i % 100 == 0:  # Progress update every 100 records
-                        logger.info(f"Progress: {i}/{total_records} records processed")
-                else:
-                    failed_migrations += 1
-                    logger.error(f"Record {i}: Failed to get inserted ID")
+                if len(batch) >= BATCH_SIZE:
+                    flush_batch()
                     
             except MigrationError as e:
                 # Check if it's a foreign key violation
                 if "not found in" in str(e):
                     foreign_key_violations += 1
-                    logger.warning(f"Record {i}: Foreign key violation - {e}")
+                    logger.warning("Record %s: Foreign key violation - %s", i, e)
                 elif "Invalid amount" in str(e):
                     data_quality_issues += 1
-                    logger.warning(f"Record {i}: Data quality issue - {e}")
+                    logger.warning("Record %s: Data quality issue - %s", i, e)
                 else:
                     failed_migrations += 1
-                    logger.error(f"Record {i}: Migration failed - {e}")
+                    logger.error("Record %s: Migration failed - %s", i, e)
                 continue
             except Exception as e:
                 failed_migrations += 1
-                logger.error(f"Record {i}: Migration failed - {e}")
+                logger.error("Record %s: Migration failed - %s", i, e)
                 continue
         
-        # Commit transaction
+        if batch:
+            flush_batch()
+        
+        # Rebuild secondary indexes in one pass now that the data is loaded
+        recreate_indexes(postgres_cursor, dropped_indexes)
+        advance_ics_id_sequence(postgres_cursor)
         postgres_conn.commit()
-        logger.info("✅ Transaction committed successfully")
+        clear_pending_restore()
+        dropped_indexes = []
+        logger.info("✅ All batches committed successfully")
         
         # Final summary
         logger.info("=" * 60)
@@ -318,6 +524,7 @@ def migrate_data():
         logger.info(f"Total records processed: {total_records}")
         logger.info(f"Successful migrations: {successful_migrations}")
         logger.info(f"Failed migrations: {failed_migrations}")
+        logger.info(f"Already migrated (skipped): {already_migrated}")
         logger.info(f"Data quality issues: {data_quality_issues}")
         logger.info(f"Foreign key violations: {foreign_key_violations}")
         logger.info(f"Success rate: {(successful_migrations/total_records)*100:.2f}%")
@@ -336,44 +543,37 @@ def migrate_data():
             
     except Exception as e:
         logger.error(f"Critical migration error: {e}")
-        if postgres_conn:
-            postgres_conn.rollback()
-            logger.info("Transaction rolled back due to error")
+        postgres_conn.rollback()
+        logger.info("Current batch rolled back due to error; committed batches are kept")
         raise
-        
     finally:
-        # Close connections
-        if mysql_conn:
-            mysql_conn.close()
-            logger.info("MySQL connection closed")
-        if postgres_conn:
-            postgres_conn.close()
-            logger.info("PostgreSQL connection closed")
+        if dropped_indexes:
+            # The drop was committed before the load; put the indexes back on every
+            # exit path, including KeyboardInterrupt
+            try:
+                postgres_conn.rollback()
+                recreate_indexes(postgres_conn.cursor(), dropped_indexes)
+                postgres_conn.commit()
+                clear_pending_restore()
+            except Exception as e:
+                logger.error(f"Could not rebuild dropped indexes, the next run will retry: {e}")
 
-def verify_migration():
+def verify_migration(mysql_conn, postgres_conn):
     """
     Verify the migration by comparing record counts and checking for orphaned records
-    """
-    mysql_conn = None
-    postgres_conn = None
     
+    Args:
+        mysql_conn: MySQL connection
+        postgres_conn: PostgreSQL connection
+    """
     try:
         logger.info("Starting migration verification...")
         
-        # Establish connections
-        mysql_conn = get_mysql_connection()
-        postgres_conn = get_postgres_connection()
-        
         mysql_cursor = mysql_conn.cursor()
         postgres_cursor = postgres_conn.cursor()
         
         # Count source records
-        mysql_cursor.execute("""
-            SELECT COUNT(*) 
-            FROM tbl_client_invoice_details d
-            INNER JOIN tbl_client_invoice_reports r ON d.id = r.client_invoice_details_id
-        """)
-        source_count = mysql_cursor.fetchone()[0]
+        source_count = count_source_data(mysql_cursor)
         
         # Count migrated records
         postgres_cursor.execute('SELECT COUNT(*) FROM "InvoiceCaseServices"')
@@ -382,21 +582,19 @@ def verify_migration():
         logger.info(f"Source records (MySQL): {source_count}")
         logger.info(f"Target records (PostgreSQL): {target_count}")
         
-        # Check for orphaned invoiceId records (should be 0 since we validate foreign keys)
+        # Check for orphaned invoiceId and caseId records in one pass
+        # (both should be 0 since we validate foreign keys)
         postgres_cursor.execute('''
-            SELECT COUNT(*) FROM "InvoiceCaseServices" ics
-            LEFT JOIN "Invoices" i ON ics."invoiceId" = i."iId"
-            WHERE i."iId" IS NULL
+            SELECT
+                COUNT(*) FILTER (WHERE NOT EXISTS (
+                    SELECT 1 FROM "Invoices" i WHERE i."iId" = ics."invoiceId"
+                )),
+                COUNT(*) FILTER (WHERE NOT EXISTS (
+                    SELECT 1 FROM "Cases" c WHERE c."cId" = ics."caseId"
+                ))
+            FROM "InvoiceCaseServices" ics
         ''')
-        orphaned_invoices = postgres_cursor.fetchone()[0]
-        
-        # Check for orphaned caseId records (should be 0 since we validate foreign keys)
-        postgres_cursor.execute('''
-            SELECT COUNT(*) FROM "InvoiceCaseServices" ics
-            LEFT JOIN "Cases" c ON ics."caseId" = c."cId"
-            WHERE c."cId" IS NULL
-        ''')
-        orphaned_cases = postgres_cursor.fetchone()[0]
+        orphaned_invoices, orphaned_cases = postgres_cursor.fetchone()
         
         if orphaned_invoices == 0 and orphaned_cases == 0:
             logger.info("✅ No orphaned records found - all foreign key relationships are valid")
@@ -410,24 +608,27 @@ def verify_migration():
             
     except Exception as e:
         logger.error(f"Verification error: {e}")
-        
-    finally:
-        if mysql_conn:
-            mysql_conn.close()
-        if postgres_conn:
-            postgres_conn.close()
 
 if __name__ == "__main__":
+    mysql_conn = None
+    postgres_conn = None
+    
     try:
         # Print header
         print("🚀 Starting Migration: tbl_client_invoice_details & tbl_client_invoice_reports → InvoiceCaseServices")
         print("=" * 80)
         
+        # Establish connections once for both migration and verification
+        logger.info("Establishing database connections...")
+        mysql_conn = get_mysql_connection()
+        postgres_conn = get_postgres_connection()
+        logger.info("✅ Database connections established")
+        
         # Run migration
-        migrate_data()
+        migrate_data(mysql_conn, postgres_conn)
         
         # Verify migration
-        verify_migration()
+        verify_migration(mysql_conn, postgres_conn)
         
         print("=" * 80)
         print("✅ Migration completed! Check the log file for detailed information.")
@@ -438,4 +639,12 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"❌ Migration failed: {e}")
         sys.exit(1)
-
+        
+    finally:
+        # Close connections
+        if mysql_conn:
+            mysql_conn.close()
+            logger.info("MySQL connection closed")
+        if postgres_conn:
+            put_postgres_connection(postgres_conn)
+            logger.info("PostgreSQL connection closed")
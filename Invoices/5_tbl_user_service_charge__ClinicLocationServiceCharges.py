@@ -14,17 +14,17 @@ Mapping Rules:
 
 import sys
 import os
+import io
+import csv
+import json
 import logging
-import colorama
-from colorama import Fore, Style
 from datetime import datetime
 from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # Add parent directory to path to import db_connections
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_connections import get_mysql_connection, get_postgres_connection
-
-colorama.init(autoreset=True)
+from db_connections import get_mysql_connection, get_postgres_connection, put_postgres_connection, create_postgres_pool
 
 log_dir = 'invoice_logs'
 if not os.path.exists(log_dir):
@@ -41,181 +41,268 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def setup_logging():
-    """
-    Setup logging configuration for both file and console output
-    """
-    # Setup logging directory relative to script location
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    logs_dir = os.path.join(script_dir, "invoice_logs")
-    if not os.path.exists(logs_dir):
-        os.makedirs(logs_dir)
-    
-    # Create log filename with timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_filename = os.path.join(logs_dir, f"5_tbl_user_service_charge__ClinicLocationServiceCharges.log")
-    
-    # Create logger
-    logger = logging.getLogger('migration_logger')
-    logger.setLevel(logging.DEBUG)
-    
-    # Clear any existing handlers
-    logger.handlers.clear()
-    
-    # Create file handler for detailed logs
-    file_handler = logging.FileHandler(log_filename, encoding='utf-8')
-    file_handler.setLevel(logging.DEBUG)
-    file_formatter = logging.Formatter(
-        '%(asctime)s - %(levelname)s - %(funcName)s:%(lineno)d - %(message)s'
-    )
-    file_handler.setFormatter(file_formatter)
-    
-    # Create console handler for user-friendly output
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
-    console_formatter = logging.Formatter('%(levelname)s - %(message)s')
-    console_handler.setFormatter(console_formatter)
-    
-    # Add handlers to logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
-    return logger, log_filename
+# Number of rows sent per COPY and committed together
+BATCH_SIZE = 5000
 
-def log_colored_message(logger, level, message, color=None):
-    """
-    Log message with color to console and plain text to file
-    """
-    # Log to file (plain text)
-    getattr(logger, level.lower())(message)
-    
-    # Print colored message to console
-    if color:
-        print(color + message)
-    else:
-        print(message)
+# Number of batches loaded concurrently, each on its own pooled connection
+MAX_WORKERS = 4
 
-def build_clinic_location_mapping(postgres_cursor):
+# Old services_id -> new serviceId; ids not listed map to themselves
+SERVICE_ID_MAP = {6: 5}
+
+# Shared default for missing price/rush_fee
+ZERO_AMOUNT = Decimal('0.00')
+
+# Foreign keys, indexes and the clscId default dropped for the load are recorded here
+# until they are restored, so a run that is killed mid-load gets them back on the next run
+PENDING_RESTORE_FILE = os.path.join(log_dir, '5_tbl_user_service_charge__ClinicLocationServiceCharges.pending_restore.json')
+
+def build_clinic_location_mapping(postgres_conn):
     """
-    Build mapping from user_id to clinicLocationId using the 3-step chain:
+    Build mapping from user_id to clinicLocationId by resolving the 3-step chain
+    in a single JOIN:
     1. user_id -> Users.olduserid -> Users.uId
     2. Users.uId -> Clinics.ownerUserId -> Clinics.cId  
     3. Clinics.cId -> ClinicLocations.clinicId -> ClinicLocations.clId
     """
     try:
-        # Build mappings for each step
-        # Step 1: Build olduserid -> uId mapping
-        postgres_cursor.execute('SELECT "uId", "olduserid" FROM "Users" WHERE "olduserid" IS NOT NULL')
-        olduserid_to_uid = {row[1]: row[0] for row in postgres_cursor.fetchall()}
-        
-        # Step 2: Build uId -> cId mapping from Clinics
-        postgres_cursor.execute('SELECT "cId", "ownerUserId" FROM "Clinics" WHERE "ownerUserId" IS NOT NULL')
-        uid_to_cid = {row[1]: row[0] for row in postgres_cursor.fetchall()}
+        # Server-side cursor so the JOIN result is pulled in chunks, not all at once
+        with postgres_conn.cursor(name='cl_map') as cur:
+            cur.itersize = 10000
+            cur.execute('''
+                SELECT u."olduserid", cl."clId"
+                FROM "Users" u
+                JOIN "Clinics" c ON c."ownerUserId" = u."uId"
+                JOIN "ClinicLocations" cl ON cl."clinicId" = c."cId"
+                WHERE u."olduserid" IS NOT NULL
+            ''')
+            user_to_clid = {int(olduserid): clid for olduserid, clid in cur}
         
-        # Step 3: Build cId -> clId mapping from ClinicLocations
-        postgres_cursor.execute('SELECT "clId", "clinicId" FROM "ClinicLocations" WHERE "clinicId" IS NOT NULL')
-        cid_to_clid = {row[1]: row[0] for row in postgres_cursor.fetchall()}
-        
-        logger.info(f"Built mappings: olduserid->uId: {len(olduserid_to_uid)}, uId->cId: {len(uid_to_cid)}, cId->clId: {len(cid_to_clid)}")
-        return olduserid_to_uid, uid_to_cid, cid_to_clid
+        logger.info(f"Built mapping: user_id->clId: {len(user_to_clid)}")
+        return user_to_clid
         
     except Exception as e:
         logger.error(f"Error building clinic location mapping: {e}")
-        return {}, {}, {}
+        return {}
 
 def remove_clscid_default(postgres_cursor):
-    """Remove the default/sequence from clscId in ClinicLocationServiceCharges table so we can insert explicit values."""
+    """
+    Remove the default/sequence from clscId in ClinicLocationServiceCharges table so we can insert explicit values.
+    
+    Returns:
+        str: The dropped default expression for restore_clscid_default, or None if nothing was dropped
+    """
+    # Savepoint keeps a failure here from aborting the migration transaction
+    postgres_cursor.execute("SAVEPOINT drop_clscid_default")
     try:
+        postgres_cursor.execute('''
+            SELECT pg_get_expr(d.adbin, d.adrelid)
+            FROM pg_attrdef d
+            JOIN pg_attribute a ON a.attrelid = d.adrelid AND a.attnum = d.adnum
+            WHERE d.adrelid = '"ClinicLocationServiceCharges"'::regclass AND a.attname = 'clscId'
+        ''')
+        row = postgres_cursor.fetchone()
+        if row is None:
+            # Earlier runs dropped the default for good; rebuild it from the owned sequence
+            postgres_cursor.execute('''
+                SELECT 'nextval(' || quote_literal(seq) || '::regclass)'
+                FROM pg_get_serial_sequence('"ClinicLocationServiceCharges"', 'clscId') AS seq
+                WHERE seq IS NOT NULL
+            ''')
+            row = postgres_cursor.fetchone()
         postgres_cursor.execute('''
             ALTER TABLE "ClinicLocationServiceCharges" ALTER COLUMN "clscId" DROP DEFAULT
         ''')
+        postgres_cursor.execute("RELEASE SAVEPOINT drop_clscid_default")
         logger.info("Dropped default/sequence from ClinicLocationServiceCharges.clscId to allow explicit inserts.")
+        return row[0] if row else None
     except Exception as e:
+        postgres_cursor.execute("ROLLBACK TO SAVEPOINT drop_clscid_default")
         logger.warning(f"Could not drop default/sequence from ClinicLocationServiceCharges.clscId: {e}")
+        return None
 
-def get_clinic_location_id(user_id, olduserid_to_uid, uid_to_cid, cid_to_clid):
+def restore_clscid_default(postgres_cursor, clscid_default):
     """
-    Get clinic location ID for a given user_id using the 3-step chain
+    Put back the clscId default dropped by remove_clscid_default and move its sequence
+    past the migrated ids, so application inserts get fresh keys. Safe to re-run.
     """
-    try:
-        # Convert user_id to int to ensure proper comparison
-        user_id = int(user_id) if user_id is not None else None
-        
-        # Step 1: user_id -> olduserid -> uId
-        uid = olduserid_to_uid.get(user_id)
-        if uid is None:
-            logger.debug(f"Step 1 failed: user_id {user_id} not found in olduserid_to_uid mapping")
-            return None
-            
-        # Step 2: uId -> ownerUserId -> cId
-        cid = uid_to_cid.get(uid)
-        if cid is None:
-            logger.debug(f"Step 2 failed: uId {uid} not found in uid_to_cid mapping")
-            return None
-            
-        # Step 3: cId -> clinicId -> clId
-        clid = cid_to_clid.get(cid)
+    postgres_cursor.execute(f'ALTER TABLE "ClinicLocationServiceCharges" ALTER COLUMN "clscId" SET DEFAULT {clscid_default}')
+    postgres_cursor.execute('''
+        SELECT setval(pg_get_serial_sequence('"ClinicLocationServiceCharges"', 'clscId'),
+                      COALESCE(MAX("clscId"), 0) + 1, false)
+        FROM "ClinicLocationServiceCharges"
+    ''')
+    logger.info("Restored default/sequence on ClinicLocationServiceCharges.clscId")
+
+def drop_foreign_keys_and_indexes(postgres_cursor):
+    """
+    Drop the foreign keys and non-constraint indexes on ClinicLocationServiceCharges
+    so the bulk load skips per-row FK checks and index maintenance. The primary key
+    and unique (clinicLocationId, serviceId) constraint are kept.
+    
+    Returns:
+        tuple: (foreign_keys, indexes) as lists of (name, definition) for restore
+    """
+    postgres_cursor.execute('''
+        SELECT conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = '"ClinicLocationServiceCharges"'::regclass AND contype = 'f'
+    ''')
+    foreign_keys = postgres_cursor.fetchall()
+    
+    postgres_cursor.execute('''
+        SELECT i.indexname, i.indexdef
+        FROM pg_indexes i
+        WHERE i.schemaname = 'public'
+          AND i.tablename = 'ClinicLocationServiceCharges'
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_constraint c
+              WHERE c.conrelid = '"ClinicLocationServiceCharges"'::regclass AND c.conname = i.indexname
+          )
+    ''')
+    indexes = postgres_cursor.fetchall()
+    
+    for name, _ in foreign_keys:
+        postgres_cursor.execute(f'ALTER TABLE "ClinicLocationServiceCharges" DROP CONSTRAINT "{name}"')
+        logger.info(f"Dropped foreign key {name} for bulk load")
+    for name, _ in indexes:
+        postgres_cursor.execute(f'DROP INDEX IF EXISTS "{name}"')
+        logger.info(f"Dropped index {name} for bulk load")
+    
+    return foreign_keys, indexes
+
+def restore_foreign_keys_and_indexes(postgres_cursor, foreign_keys, indexes):
+    """
+    Recreate what drop_foreign_keys_and_indexes removed: indexes are built in one pass,
+    foreign keys are added NOT VALID and then validated with a single scan.
+    Safe to re-run after a partial restore; anything already present is kept.
+    """
+    for name, definition in indexes:
+        # indexdef is "CREATE [UNIQUE] INDEX <name> ON ..."
+        postgres_cursor.execute(definition.replace(" INDEX ", " INDEX IF NOT EXISTS ", 1))
+        logger.info(f"Rebuilt index {name}")
+    for name, definition in foreign_keys:
+        postgres_cursor.execute('''
+            SELECT 1 FROM pg_constraint
+            WHERE conrelid = '"ClinicLocationServiceCharges"'::regclass AND conname = %s
+        ''', (name,))
+        if postgres_cursor.fetchone() is None:
+            postgres_cursor.execute(f'ALTER TABLE "ClinicLocationServiceCharges" ADD CONSTRAINT "{name}" {definition} NOT VALID')
+        # No-op if the constraint is already validated
+        postgres_cursor.execute(f'ALTER TABLE "ClinicLocationServiceCharges" VALIDATE CONSTRAINT "{name}"')
+        logger.info(f"Restored foreign key {name}")
+
+def save_pending_restore(foreign_keys, indexes, clscid_default):
+    """Record what was dropped for the load until its restore has committed."""
+    with open(PENDING_RESTORE_FILE, 'w') as f:
+        json.dump({'foreign_keys': foreign_keys, 'indexes': indexes, 'clscid_default': clscid_default}, f)
+
+def load_pending_restore():
+    """
+    Returns:
+        tuple: (foreign_keys, indexes, clscid_default) left over from an interrupted run, or ([], [], None)
+    """
+    if not os.path.exists(PENDING_RESTORE_FILE):
+        return [], [], None
+    with open(PENDING_RESTORE_FILE) as f:
+        pending = json.load(f)
+    return pending['foreign_keys'], pending['indexes'], pending.get('clscid_default')
+
+def restore_dropped(postgres_cursor, foreign_keys, indexes, clscid_default):
+    """Undo everything migrate_data dropped for the load."""
+    restore_foreign_keys_and_indexes(postgres_cursor, foreign_keys, indexes)
+    if clscid_default:
+        restore_clscid_default(postgres_cursor, clscid_default)
+
+def clear_pending_restore():
+    if os.path.exists(PENDING_RESTORE_FILE):
+        os.remove(PENDING_RESTORE_FILE)
+
+def get_clinic_location_id(user_id, user_to_clid):
+    """
+    Get clinic location ID for a given user_id from the prebuilt mapping
+    """
+    # user_id arrives as int from MySQL and the mapping keys are int at build time
+    clid = user_to_clid.get(user_id)
+    
+    # Keep the per-row hot path free of debug formatting unless DEBUG is on
+    if logger.isEnabledFor(logging.DEBUG):
         if clid is None:
-            logger.debug(f"Step 3 failed: cId {cid} not found in cid_to_clid mapping")
-            return None
-            
-        logger.debug(f"Successfully mapped user_id {user_id} -> uId {uid} -> cId {cid} -> clId {clid}")
-        return clid
-        
-    except Exception as e:
-        logger.error(f"Error getting clinic location ID for user_id {user_id}: {e}")
-        return None
+            logger.debug("user_id %s not found in user_to_clid mapping", user_id)
+        else:
+            logger.debug("Successfully mapped user_id %s -> clId %s", user_id, clid)
+    
+    return clid
 
-def get_valid_services(postgres_cursor):
+def get_valid_services(postgres_conn):
     """
     Get all valid service IDs from MasterServices table
     """
     try:
-        postgres_cursor.execute('SELECT "sId" FROM "MasterServices"')
-        valid_services = set(row[0] for row in postgres_cursor.fetchall())
+        with postgres_conn.cursor(name='valid_services') as cur:
+            cur.itersize = 10000
+            cur.execute('SELECT "sId" FROM "MasterServices"')
+            valid_services = set(row[0] for row in cur)
         return valid_services
     except Exception as e:
         logger.error(f"Error getting valid services: {e}")
         return set()
 
-def map_service_id(old_service_id):
+def insert_batch(postgres_cursor, batch):
     """
-    Map service ID: if old_service_id=6, return 5, otherwise return same value
+    Load a batch of records into ClinicLocationServiceCharges with COPY FROM STDIN
+    
+    Returns:
+        int: Number of records inserted
     """
-    if old_service_id == 6:
-        return 5
-    return old_service_id
-
-def validate_foreign_keys(postgres_cursor, clinic_location_id, service_id):
+    copy_query = """
+    COPY "ClinicLocationServiceCharges" (
+        "clscId", "clinicLocationId", "serviceId", amount, "rushFee", "createdAt", "updatedAt"
+    ) FROM STDIN WITH (FORMAT CSV, NULL '')
     """
-    Validate that clinicLocationId and serviceId exist in their respective parent tables.
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for clsc_id, clinic_location_id, service_id, amount, rush_fee_amount, created_at, updated_at in batch:
+        writer.writerow([
+            clsc_id,
+            clinic_location_id,
+            service_id,
+            str(amount),
+            str(rush_fee_amount),
+            created_at.isoformat(),
+            updated_at.isoformat() if updated_at else ''
+        ])
+    buf.seek(0)
     
-    Args:
-        postgres_cursor: PostgreSQL cursor
-        clinic_location_id: Clinic Location ID to validate
-        service_id: Service ID to validate
+    postgres_cursor.copy_expert(copy_query, buf)
+    return len(batch)
+
+def load_chunk(postgres_pool, batch):
+    """
+    Worker: load one batch on a pooled connection and commit it.
+    A failing batch is rolled back on its own; other batches are unaffected.
     
     Returns:
-        tuple: (clinic_location_exists, service_exists)
+        int: Number of records inserted
     """
+    conn = postgres_pool.getconn()
     try:
-        # Check if clinic location exists
-        postgres_cursor.execute('SELECT COUNT(*) FROM "ClinicLocations" WHERE "clId" = %s', (clinic_location_id,))
-        clinic_location_exists = postgres_cursor.fetchone()[0] > 0
-        
-        # Check if service exists
-        postgres_cursor.execute('SELECT COUNT(*) FROM "MasterServices" WHERE "sId" = %s', (service_id,))
-        service_exists = postgres_cursor.fetchone()[0] > 0
-        
-        return clinic_location_exists, service_exists
-        
-    except Exception as e:
-        logger.error(f"Error validating foreign keys: {e}")
-        return False, False
+        with conn.cursor() as cursor:
+            # The load is replayable (the table is truncated first), so skip the WAL fsync
+            cursor.execute("SET LOCAL synchronous_commit = off")
+            inserted = insert_batch(cursor, batch)
+        conn.commit()
+        return inserted
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        postgres_pool.putconn(conn)
 
-def get_source_data(mysql_cursor):
+def iter_source_data(mysql_cursor):
     """
-    Fetch all data from tbl_user_service_charge
+    Stream all data from tbl_user_service_charge row by row
+    (mysql_cursor must be unbuffered so the result set is not loaded up front)
     """
     query = """
     SELECT 
@@ -236,128 +323,190 @@ def get_source_data(mysql_cursor):
     ORDER BY usc_id
     """
     mysql_cursor.execute(query)
-    return mysql_cursor.fetchall()
+    yield from mysql_cursor
+
+def prepare_rows(source_data, user_to_clid, valid_services, stats):
+    """
+    Map and validate source rows, yielding insert-ready tuples.
+    Skipped and failed records are counted in stats.
+    """
+    # One migration timestamp for rows without add_time
+    now = datetime.now()
+    # UNIQUE ("clinicLocationId", "serviceId") stays on during the load, and one
+    # duplicate would fail a whole COPY batch; keep the first row (lowest usc_id)
+    seen_keys = set()
+    
+    for usc_id, services_id, user_id, price, rush_fee, status, position, add_ip, add_time, add_by, update_ip, update_time, update_by in source_data:
+        stats['total_records'] += 1
+        try:
+            # Map service ID
+            mapped_service_id = SERVICE_ID_MAP.get(services_id, services_id)
+            
+            # Map clinic location ID using the prebuilt user_id -> clId mapping
+            clinic_location_id = get_clinic_location_id(user_id, user_to_clid)
+            if clinic_location_id is None:
+                logger.warning("Skipping record %s: user_id %s could not be mapped to a valid clinicLocationId", usc_id, user_id)
+                stats['skipped_invalid_mapping'] += 1
+                continue
+            
+            # Validate foreign key relationships
+            if mapped_service_id not in valid_services:
+                logger.warning("Record %s: Service ID %s does not exist in MasterServices table - skipping", usc_id, mapped_service_id)
+                stats['foreign_key_violations'] += 1
+                continue
+            
+            # Prepare values
+            # MySQL DECIMAL columns already arrive as Decimal; only other types are converted
+            if price is None:
+                amount = ZERO_AMOUNT
+            else:
+                amount = price if isinstance(price, Decimal) else Decimal(str(price))
+            if rush_fee is None:
+                rush_fee_amount = ZERO_AMOUNT
+            else:
+                rush_fee_amount = rush_fee if isinstance(rush_fee, Decimal) else Decimal(str(rush_fee))
+            created_at = add_time if add_time else now
+            updated_at = update_time if update_time else None
+            
+            key = (clinic_location_id, mapped_service_id)
+            if key in seen_keys:
+                logger.warning("Skipping record %s: duplicate clinicLocationId %s / serviceId %s", usc_id, clinic_location_id, mapped_service_id)
+                stats['duplicate_keys'] += 1
+                continue
+            seen_keys.add(key)
+        except Exception as e:
+            stats['failed_migrations'] += 1
+            logger.error("Record %s: Migration failed - %s", usc_id, e)
+            continue
+        
+        yield (
+            usc_id,               # clscId (primary key)
+            clinic_location_id,   # clinicLocationId (mapped)
+            mapped_service_id,    # serviceId (mapped)
+            amount,               # amount
+            rush_fee_amount,      # rushFee
+            created_at,           # createdAt
+            updated_at            # updatedAt
+        )
 
 def migrate_data():
     mysql_conn = None
     postgres_conn = None
+    postgres_pool = None
+    executor = None
+    foreign_keys, indexes, clscid_default = [], [], None
     try:
         logger.info("Establishing database connections...")
         mysql_conn = get_mysql_connection()
         postgres_conn = get_postgres_connection()
-        mysql_cursor = mysql_conn.cursor()
+        mysql_cursor = mysql_conn.cursor(buffered=False)
         postgres_cursor = postgres_conn.cursor()
 
+        # A previous run that was killed mid-load left its drops recorded; put them back first
+        foreign_keys, indexes, clscid_default = load_pending_restore()
+        if foreign_keys or indexes or clscid_default:
+            logger.warning("Restoring foreign keys, indexes and clscId default left dropped by an interrupted run...")
+            restore_dropped(postgres_cursor, foreign_keys, indexes, clscid_default)
+            postgres_conn.commit()
+            clear_pending_restore()
+            foreign_keys, indexes, clscid_default = [], [], None
+
         # Truncate the table and reset the sequence for clscId
         logger.info("Truncating ClinicLocationServiceCharges and resetting clscId sequence to 1...")
         postgres_cursor.execute('TRUNCATE TABLE "ClinicLocationServiceCharges" RESTART IDENTITY CASCADE')
-        postgres_conn.commit()
         logger.info("Table truncated and sequence reset.")
 
-        # Drop default from clscId to allow explicit inserts
-        remove_clscid_default(postgres_cursor)
+        # Drop default from clscId to allow explicit inserts; it is put back after the load
+        clscid_default = remove_clscid_default(postgres_cursor)
+        
+        # Defer foreign key checks and index maintenance until the table is loaded
+        foreign_keys, indexes = drop_foreign_keys_and_indexes(postgres_cursor)
+        save_pending_restore(foreign_keys, indexes, clscid_default)
+        
+        # Commit the TRUNCATE before loading: its exclusive lock would otherwise
+        # block the worker connections
         postgres_conn.commit()
 
         # Build clinic location mapping
         logger.info("Building clinic location mapping...")
-        olduserid_to_uid, uid_to_cid, cid_to_clid = build_clinic_location_mapping(postgres_cursor)
+        user_to_clid = build_clinic_location_mapping(postgres_conn)
         
         # Debug: Check if user_id=1023 exists in the mapping
-        if 1023 in olduserid_to_uid:
-            logger.warning(f"user_id=1023 found in olduserid_to_uid mapping with uId={olduserid_to_uid[1023]}")
+        if 1023 in user_to_clid:
+            logger.warning(f"user_id=1023 found in user_to_clid mapping with clId={user_to_clid[1023]}")
         else:
-            logger.info(f"user_id=1023 NOT found in olduserid_to_uid mapping - this is correct, should be skipped")
+            logger.info(f"user_id=1023 NOT found in user_to_clid mapping - this is correct, should be skipped")
         
         # Show some sample mappings for debugging
-        sample_olduserids = list(olduserid_to_uid.keys())[:5]
+        sample_olduserids = list(user_to_clid.keys())[:5]
         logger.info(f"Sample olduserid values in mapping: {sample_olduserids}")
 
-        # Get valid services
-        valid_services = get_valid_services(postgres_cursor)
+        # Get valid services; foreign keys are checked in memory instead of per-row
+        # queries (every mapped clId comes from the ClinicLocations JOIN, so it exists)
+        valid_services = get_valid_services(postgres_conn)
 
-        # Fetch source data
-        logger.info("Fetching source data from tbl_user_service_charge...")
-        source_data = get_source_data(mysql_cursor)
-        logger.info(f"Found {len(source_data)} records to migrate")
-        if not source_data:
-            logger.warning("No data found to migrate")
-            return
+        # Stream source data; rows are read from MySQL while batches are written
+        logger.info("Streaming source data from tbl_user_service_charge...")
+        source_data = iter_source_data(mysql_cursor)
 
         # Migration counters
-        total_records = len(source_data)
         successful_migrations = 0
         failed_migrations = 0
-        skipped_invalid_mapping = 0
-        foreign_key_violations = 0
 
         logger.info("Starting data migration...")
         logger.info("Note: Foreign key validation will be performed - only records with valid clinicLocationId and serviceId will be migrated")
         
-        for i, (usc_id, services_id, user_id, price, rush_fee, status, position, add_ip, add_time, add_by, update_ip, update_time, update_by) in enumerate(source_data, 1):
-            try:
-                # Debug logging for specific user_id
-                if user_id == 1023:
-                    logger.info(f"Processing record {usc_id} with user_id=1023")
-                
-                # Map service ID
-                mapped_service_id = map_service_id(services_id)
-                
-                # Map clinic location ID using the 3-step chain
-                clinic_location_id = get_clinic_location_id(user_id, olduserid_to_uid, uid_to_cid, cid_to_clid)
-                if clinic_location_id is None:
-                    logger.warning(f"Skipping record {usc_id}: user_id {user_id} could not be mapped to a valid clinicLocationId")
-                    skipped_invalid_mapping += 1
-                    continue
-                
-                # Debug logging for successful mapping
-                if user_id == 1023:
-                    logger.info(f"Record {usc_id} with user_id=1023 got clinic_location_id={clinic_location_id}")
-                
-                # Validate foreign key relationships
-                clinic_location_exists, service_exists = validate_foreign_keys(postgres_cursor, clinic_location_id, mapped_service_id)
-                
-                if not clinic_location_exists:
-                    logger.warning(f"Record {usc_id}: Clinic Location ID {clinic_location_id} does not exist in ClinicLocations table - skipping")
-                    foreign_key_violations += 1
-                    continue
-                
-                if not service_exists:
-                    logger.warning(f"Record {usc_id}: Service ID {mapped_service_id} does not exist in MasterServices table - skipping")
-                    foreign_key_violations += 1
-                    continue
-                
-                # Prepare values
-                amount = Decimal(str(price)) if price is not None else Decimal('0.00')
-                rush_fee_amount = Decimal(str(rush_fee)) if rush_fee is not None else Decimal('0.00')
-                created_at = add_time if add_time else datetime.now()
-                updated_at = update_time if update_time else None
-                
-                insert_query = """
-                INSERT INTO "ClinicLocationServiceCharges" (
-                    "clscId", "clinicLocationId", "serviceId", amount, "rushFee", "createdAt", "updatedAt"
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """
-                values = (
-                    usc_id,               # clscId (primary key)
-                    clinic_location_id,   # clinicLocationId (mapped)
-                    mapped_service_id,    # serviceId (mapped)
-                    amount,               # amount
-                    rush_fee_amount,      # rushFee
-                    created_at,           # createdAt
-                    updated_at            # updatedAt
-                )
-                postgres_cursor.execute(insert_query, values)
-                successful_migrations += 1
-                if successful_migrations % 100 == 0:
+        postgres_pool = create_postgres_pool(1, MAX_WORKERS)
+        executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        pending = {}
+        batch = []
+        
+        def collect(futures):
+            # Results are gathered on the main thread, so the counters need no lock
+            nonlocal successful_migrations, failed_migrations
+            for future in futures:
+                chunk = pending.pop(future)
+                try:
+                    successful_migrations += future.result()
                     logger.info(f"Migrated {successful_migrations} records...")
-                    postgres_conn.commit()
-            except Exception as e:
-                failed_migrations += 1
-                logger.error(f"Record {usc_id}: Migration failed - {e}")
-                postgres_conn.rollback()
-                continue
+                except Exception as e:
+                    failed_migrations += len(chunk)
+                    logger.error(f"Batch of {len(chunk)} records (clscId {chunk[0][0]}-{chunk[-1][0]}): Migration failed - {e}")
+        
+        def flush_batch():
+            # Bound the number of in-flight batches so streaming keeps memory flat
+            if len(pending) >= MAX_WORKERS * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            chunk = list(batch)
+            pending[executor.submit(load_chunk, postgres_pool, chunk)] = chunk
+            batch.clear()
+        
+        # Filter/map phase is a generator, so the load loop only batches rows
+        stats = {'total_records': 0, 'failed_migrations': 0, 'skipped_invalid_mapping': 0, 'foreign_key_violations': 0, 'duplicate_keys': 0}
+        for row in prepare_rows(source_data, user_to_clid, valid_services, stats):
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                flush_batch()
+        if batch:
+            flush_batch()
+        collect(list(pending))
+        total_records = stats['total_records']
+        failed_migrations += stats['failed_migrations']
+        skipped_invalid_mapping = stats['skipped_invalid_mapping']
+        foreign_key_violations = stats['foreign_key_violations']
+        duplicate_keys = stats['duplicate_keys']
+        
+        # Rebuild indexes and foreign keys and put the clscId default back now that the data is in
+        restore_dropped(postgres_cursor, foreign_keys, indexes, clscid_default)
         postgres_conn.commit()
-        logger.info("✅ Transaction committed successfully")
+        clear_pending_restore()
+        foreign_keys, indexes, clscid_default = [], [], None
+        
+        if not total_records:
+            logger.warning("No data found to migrate")
+            return
+        logger.info("✅ All batches committed successfully")
         
         # Final summary
         logger.info("=" * 60)
@@ -368,6 +517,7 @@ def migrate_data():
         logger.info(f"Failed migrations: {failed_migrations}")
         logger.info(f"Skipped invalid mapping: {skipped_invalid_mapping}")
         logger.info(f"Foreign key violations: {foreign_key_violations}")
+        logger.info(f"Duplicate clinicLocationId/serviceId: {duplicate_keys}")
         logger.info(f"Success rate: {(successful_migrations/total_records)*100:.2f}%")
         logger.info("=" * 60)
         
@@ -377,6 +527,9 @@ def migrate_data():
         if foreign_key_violations > 0:
             logger.warning(f"⚠️  {foreign_key_violations} records had foreign key violations (missing clinicLocationId or serviceId).")
             
+        if duplicate_keys > 0:
+            logger.warning(f"⚠️  {duplicate_keys} records duplicated an existing (clinicLocationId, serviceId) pair and were skipped.")
+            
         if skipped_invalid_mapping > 0:
             logger.warning(f"⚠️  {skipped_invalid_mapping} records had invalid user_id mapping (could not find clinicLocationId).")
             
@@ -389,11 +542,25 @@ def migrate_data():
             logger.info("Transaction rolled back due to error")
         raise
     finally:
+        if executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+        if postgres_conn and (foreign_keys or indexes or clscid_default):
+            # The drops were committed before the load; put them back on every exit
+            # path, including KeyboardInterrupt
+            try:
+                postgres_conn.rollback()
+                restore_dropped(postgres_conn.cursor(), foreign_keys, indexes, clscid_default)
+                postgres_conn.commit()
+                clear_pending_restore()
+            except Exception as e:
+                logger.error(f"Could not restore foreign keys, indexes and clscId default, the next run will retry: {e}")
+        if postgres_pool:
+            postgres_pool.closeall()
         if mysql_conn:
             mysql_conn.close()
             logger.info("MySQL connection closed")
         if postgres_conn:
-            postgres_conn.close()
+            put_postgres_connection(postgres_conn)
             logger.info("PostgreSQL connection closed")
 
 if __name__ == "__main__":
@@ -6,7 +6,7 @@ from datetime import datetime
 
 # Add parent directory to path to import db_connections
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_connections import get_mysql_connection, get_postgres_connection
+from db_connections import get_mysql_connection, get_postgres_connection, put_postgres_connection
 import psycopg2.extras
 
 DEFAULT_USER_TYPE = "CLINIC_USERS"  # Updated to use the new enum value
@@ -42,21 +42,24 @@ def setup_logging():
     return logger
 
 def fetch_mysql_users():
+    """Stream users from MySQL one row at a time instead of loading the whole table"""
     logger = logging.getLogger(__name__)
     logger.info("Starting to fetch users from MySQL database")
     
     conn = get_mysql_connection()
+    fetched = 0
     try:
-        cursor = conn.cursor(dictionary=True)
+        cursor = conn.cursor(buffered=False)
         cursor.execute("""
             SELECT 
                 user_id, voxel_doctors_id, title, fname, lname, email, 
                 contact, contact_no, status, add_time, update_time 
             FROM tbl_users
         """)
-        users = cursor.fetchall()
-        logger.info(f"Successfully fetched {len(users)} users from MySQL")
-        return users
+        for user in cursor:
+            fetched += 1
+            yield user
+        logger.info(f"Successfully fetched {fetched} users from MySQL")
     except Exception as e:
         logger.error(f"Error fetching users from MySQL: {str(e)}")
         raise
@@ -66,16 +69,18 @@ def fetch_mysql_users():
 
 def transform_users(mysql_users):
     logger = logging.getLogger(__name__)
-    logger.info(f"Starting transformation of {len(mysql_users)} users")
+    logger.info("Starting transformation of users")
     
     transformed = []
     invalid_users = []
+    
+    # One migration timestamp for rows without add_time/update_time
+    now = datetime.now()
 
-    for user in mysql_users:
-        email = user.get("email")
-        first_name = user.get("fname") or "Unknown"
-        last_name = user.get("lname") or ""
-        old_user_id = user.get("user_id")
+    for (old_user_id, voxel_doctors_id, title, fname, lname, email,
+         contact, contact_no, status, add_time, update_time) in mysql_users:
+        first_name = fname or "Unknown"
+        last_name = lname or ""
         
         if not email or not first_name:
             invalid_users.append({
@@ -84,16 +89,16 @@ def transform_users(mysql_users):
                 'first_name': first_name,
                 'reason': 'Missing email or first name'
             })
-            logger.warning(f"Skipping invalid user ID {old_user_id}: missing email or first name")
+            logger.warning("Skipping invalid user ID %s: missing email or first name", old_user_id)
             continue
 
         sub = str(uuid.uuid4())
-        name_title = user.get("title") or None
-        status = bool(user.get("status", 0))  # convert tinyint to bool
+        name_title = title or None
+        status = bool(status)  # convert tinyint to bool
         is_deleted = False
-        created_at = user.get("add_time") or datetime.now()
-        updated_at = user.get("update_time") or datetime.now()
-        mobile = str(user.get("contact") or user.get("contact_no") or "")
+        created_at = add_time or now
+        updated_at = update_time or now
+        mobile = str(contact or contact_no or "")
 
         transformed.append((
             sub,
@@ -110,7 +115,7 @@ def transform_users(mysql_users):
             old_user_id
         ))
         
-        logger.debug(f"Transformed user {old_user_id}: {email} ({first_name} {last_name})")
+        logger.debug("Transformed user %s: %s (%s %s)", old_user_id, email, first_name, last_name)
 
     logger.info(f"Transformation completed: {len(transformed)} valid users, {len(invalid_users)} invalid users")
     
@@ -130,7 +135,22 @@ def insert_postgres_users(user_data_list):
     updated_users = []
     
     try:
+        # Load every existing user once, keyed by the case-insensitive, trimmed match
+        # (server-side cursor so the Users table is pulled in chunks)
+        existing_users = {}
+        with conn.cursor(name='users_scan') as scan_cursor:
+            scan_cursor.itersize = 10000
+            scan_cursor.execute('''
+                SELECT "uId", sub, "olduserid",
+                       LOWER(TRIM(email)), LOWER(TRIM("firstName")), LOWER(TRIM("lastName"))
+                FROM "Users"
+            ''')
+            for uid, sub, olduserid, email_lc, first_name_lc, last_name_lc in scan_cursor:
+                existing_users.setdefault((email_lc, first_name_lc, last_name_lc), []).append((uid, sub, olduserid))
+        
         with conn.cursor() as cursor:
+            # uId -> olduserid; later source rows win, as with sequential updates
+            updates = {}
             for user in user_data_list:
                 email = user[2]  # email is 3rd in tuple
                 first_name = user[4]  # firstName is 5th in tuple
@@ -138,29 +158,14 @@ def insert_postgres_users(user_data_list):
                 old_user_id = user[11]  # oldUserId is 12th in tuple
                 
                 # Prepare lowercased, trimmed values
-                email_lc = email.strip().lower()
-                first_name_lc = first_name.strip().lower()
-                last_name_lc = last_name.strip().lower()
-
-                # Check for existing user using case-insensitive, trimmed match
-                cursor.execute('''
-                    SELECT "uId", sub, "olduserid" FROM "Users" 
-                    WHERE LOWER(TRIM(email)) = %s AND LOWER(TRIM("firstName")) = %s AND LOWER(TRIM("lastName")) = %s
-                ''', (email_lc, first_name_lc, last_name_lc))
+                key = (email.strip().lower(), first_name.strip().lower(), last_name.strip().lower())
                 
-                existing_user = cursor.fetchone()
-                if existing_user:
-                    existing_uid = existing_user[0]
-                    existing_sub = existing_user[1]
-                    existing_olduserid = existing_user[2]
-                    
-                    # Update the olduserid for the existing user
-                    cursor.execute('''
-                        UPDATE "Users" 
-                        SET "olduserid" = %s, "updatedAt" = %s
-                        WHERE LOWER(TRIM(email)) = %s AND LOWER(TRIM("firstName")) = %s AND LOWER(TRIM("lastName")) = %s
-                    ''', (old_user_id, datetime.now(), email_lc, first_name_lc, last_name_lc))
-                    
+                matches = existing_users.get(key)
+                if not matches:
+                    continue  # do nothing if user does not exist
+                
+                for existing_uid, existing_sub, existing_olduserid in matches:
+                    updates[existing_uid] = old_user_id
                     updated_users.append({
                         'old_user_id': old_user_id,
                         'email': email,
@@ -170,9 +175,17 @@ def insert_postgres_users(user_data_list):
                         'existing_sub': existing_sub,
                         'previous_olduserid': existing_olduserid
                     })
-                    logger.info(f"✅ Updated existing user: {email} ({first_name} {last_name}) - uId: {existing_uid}, set olduserid: {old_user_id}")
-                    updated_count += 1
-                # No else: do nothing if user does not exist
+                    logger.info("✅ Updated existing user: %s (%s %s) - uId: %s, set olduserid: %s", email, first_name, last_name, existing_uid, old_user_id)
+                updated_count += 1
+            
+            # Apply all updates in a single statement
+            now = datetime.now()
+            psycopg2.extras.execute_values(cursor, '''
+                UPDATE "Users" AS u
+                SET "olduserid" = v.old_user_id, "updatedAt" = v.updated_at
+                FROM (VALUES %s) AS v(old_user_id, updated_at, uid)
+                WHERE u."uId" = v.uid
+            ''', [(old_user_id, now, uid) for uid, old_user_id in updates.items()])
 
         conn.commit()
         logger.info(f"✅ Transaction committed successfully")
@@ -191,7 +204,7 @@ def insert_postgres_users(user_data_list):
         logger.error(f"Failed after processing {updated_count} users")
         raise
     finally:
-        conn.close()
+        put_postgres_connection(conn)
         logger.info("PostgreSQL connection closed")
 
 if __name__ == "__main__":
@@ -202,10 +215,8 @@ if __name__ == "__main__":
         logger.info("🔄 Starting full user data migration from MySQL → PostgreSQL")
         start_time = datetime.now()
 
-        mysql_users = fetch_mysql_users()
-        logger.info(f"🧑‍💻 Users fetched from MySQL: {len(mysql_users)}")
-
-        user_data_to_insert = transform_users(mysql_users)
+        # Users are streamed from MySQL straight into the transform
+        user_data_to_insert = transform_users(fetch_mysql_users())
         logger.info(f"🚀 Transformed {len(user_data_to_insert)} users for insertion")
 
         insert_postgres_users(user_data_to_insert)
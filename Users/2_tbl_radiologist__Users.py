@@ -6,6 +6,7 @@ Updates existing radiologist records in Users table with oldUserId from tbl_radi
 
 import mysql.connector
 import psycopg2
+from psycopg2.extras import execute_values
 import uuid
 from datetime import datetime
 import logging
@@ -15,7 +16,7 @@ import os
 
 # Add the parent directory to Python path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_connections import get_mysql_connection, get_postgres_connection
+from db_connections import get_mysql_connection, get_postgres_connection, put_postgres_connection
 
 # Setup logging directory relative to script location
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -39,10 +40,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+FETCH_SIZE = 10000  # rows per fetchmany() from the unbuffered MySQL cursor
+
 class RadiologistToUsersDataUpdater:
     def __init__(self):
         self.mysql_conn = None
         self.postgres_conn = None
+        self.by_email = {}
+        self.by_name = {}
         self.stats = {
             'total_mysql_records': 0,
             'total_postgres_radiologists': 0,
@@ -67,107 +72,78 @@ class RadiologistToUsersDataUpdater:
         if self.mysql_conn:
             self.mysql_conn.close()
         if self.postgres_conn:
-            self.postgres_conn.close()
+            put_postgres_connection(self.postgres_conn)
         logger.info("Database connections closed")
 
-    def find_radiologist_by_email(self, email: str) -> Optional[int]:
-        """Find radiologist in Users table by email and return their uId"""
-        try:
-            cursor = self.postgres_conn.cursor()
-            logger.info(f"Searching for radiologist in Users table with email: {email}")
-            cursor.execute("""
-                SELECT "uId", "olduserid" FROM "Users" 
-                WHERE LOWER(email) = LOWER(%s) AND "userType" = 'RADIOLOGIST'
-            """, (email,))
-            result = cursor.fetchone()
-            cursor.close()
-            if result:
-                u_id, old_user_id = result
-                if old_user_id is not None:
-                    logger.info(f"Radiologist {email} already has oldUserId: {old_user_id}")
-                    self.stats['already_has_old_id'] += 1
-                    return None
-                logger.info(f"Radiologist {email} found in Users table with uId: {u_id}")
-                return u_id
-            else:
-                logger.warning(f"Radiologist with email {email} not found in Users table (case-insensitive match)")
-                self.stats['not_found'] += 1
-                return None
-        except Exception as e:
-            logger.error(f"Error finding radiologist by email {email}: {e}")
-            return None
+    def load_postgres_radiologists(self) -> int:
+        """Load every RADIOLOGIST user once into email and name lookups, and return how many were loaded"""
+        self.by_email = {}
+        self.by_name = {}
+        cursor = self.postgres_conn.cursor()
+        cursor.execute('''
+            SELECT "uId", "olduserid", LOWER(email), LOWER(TRIM("firstName")), LOWER(TRIM("lastName"))
+            FROM "Users"
+            WHERE "userType" = 'RADIOLOGIST'
+        ''')
+        rows = cursor.fetchall()
+        cursor.close()
+        # First row per key wins, as the per-row fetchone() lookups did
+        for u_id, old_user_id, email_lc, fname_lc, lname_lc in rows:
+            if email_lc is not None:
+                self.by_email.setdefault(email_lc, (u_id, old_user_id))
+            if fname_lc is not None and lname_lc is not None:
+                self.by_name.setdefault((fname_lc, lname_lc), (u_id, old_user_id))
+        return len(rows)
 
     def find_radiologist_by_email_or_name(self, email: str, fname: str, lname: str) -> Optional[tuple]:
         """Find radiologist in Users table by email, or by first and last name (case-insensitive), and return their uId and current oldUserId"""
-        try:
-            cursor = self.postgres_conn.cursor()
-            # Strip whitespace
-            email_clean = email.strip() if email else ''
-            fname_clean = fname.strip() if fname else ''
-            lname_clean = lname.strip() if lname else ''
-            # Try email match first
-            logger.info(f"Searching for radiologist in Users table with email: '{email_clean}' (original: '{email}')")
-            cursor.execute('''
-                SELECT "uId", "olduserid" FROM "Users" 
-                WHERE LOWER(email) = LOWER(%s) AND "userType" = 'RADIOLOGIST'
-            ''', (email_clean,))
-            result = cursor.fetchone()
-            if result:
-                cursor.close()
-                u_id, old_user_id = result
-                logger.info(f"Radiologist {email_clean} found in Users table with uId: {u_id}, current oldUserId: {old_user_id}")
-                return (u_id, old_user_id)
-            # Try name match if email fails
-            logger.info(f"Email match failed for '{email_clean}'. Trying first name: '{fname_clean}', last name: '{lname_clean}' (original: '{fname}', '{lname}')")
-            cursor.execute('''
-                SELECT "uId", "olduserid" FROM "Users"
-                WHERE LOWER(TRIM("firstName")) = LOWER(%s) AND LOWER(TRIM("lastName")) = LOWER(%s) AND "userType" = 'RADIOLOGIST'
-            ''', (fname_clean, lname_clean))
-            result = cursor.fetchone()
-            cursor.close()
-            if result:
-                u_id, old_user_id = result
-                logger.info(f"Radiologist {fname_clean} {lname_clean} found in Users table with uId: {u_id}, current oldUserId: {old_user_id}")
-                return (u_id, old_user_id)
-            else:
-                logger.warning(f"Radiologist with email '{email_clean}' or name '{fname_clean} {lname_clean}' not found in Users table")
-                self.stats['not_found'] += 1
-                return None
-        except Exception as e:
-            logger.error(f"Error finding radiologist by email or name: {e}")
-            return None
+        # Strip whitespace
+        email_clean = email.strip() if email else ''
+        fname_clean = fname.strip() if fname else ''
+        lname_clean = lname.strip() if lname else ''
+        # Try email match first
+        match = self.by_email.get(email_clean.lower())
+        if match:
+            u_id, old_user_id = match
+            logger.debug("Radiologist %s found in Users table with uId: %s, current oldUserId: %s", email_clean, u_id, old_user_id)
+            return match
+        # Try name match if email fails
+        match = self.by_name.get((fname_clean.lower(), lname_clean.lower()))
+        if match:
+            u_id, old_user_id = match
+            logger.debug("Radiologist %s %s found in Users table with uId: %s, current oldUserId: %s", fname_clean, lname_clean, u_id, old_user_id)
+            return match
+        logger.warning("Radiologist with email '%s' or name '%s %s' not found in Users table", email_clean, fname_clean, lname_clean)
+        self.stats['not_found'] += 1
+        return None
 
-    def update_radiologist_old_id(self, u_id: int, old_user_id: int, email: str) -> bool:
-        """Update the oldUserId for a radiologist in Users table"""
+    def update_radiologist_old_ids(self, updates: Dict[int, int]) -> None:
+        """Apply all uId -> oldUserId updates as set-based UPDATE ... FROM (VALUES ...) statements"""
         try:
             cursor = self.postgres_conn.cursor()
-            logger.info(f"Attempting to update oldUserId for email: '{email}', uId: {u_id}, oldUserId: {old_user_id}")
-            update_query = """
-                UPDATE "Users" 
-                SET "olduserid" = %s, "updatedAt" = %s
-                WHERE "uId" = %s AND "userType" = 'RADIOLOGIST'
-            """
-            cursor.execute(update_query, (old_user_id, datetime.now(), u_id))
-            rows_affected = cursor.rowcount
+            logger.info(f"Updating oldUserId for {len(updates)} radiologists")
+            # Single transaction committed by run_update(); no need to wait on the WAL flush
+            cursor.execute("SET LOCAL synchronous_commit = off")
+            # "updatedAt" comes from the server's now(), one timestamp for the whole transaction
+            execute_values(cursor, """
+                UPDATE "Users" AS u
+                SET "olduserid" = v.old_user_id, "updatedAt" = now()
+                FROM (VALUES %s) AS v(old_user_id, uid)
+                WHERE u."uId" = v.uid AND u."userType" = 'RADIOLOGIST'
+            """, [(old_user_id, u_id) for u_id, old_user_id in updates.items()], page_size=1000)
             cursor.close()
-            logger.info(f"Rows affected by update: {rows_affected}")
-            if rows_affected > 0:
-                logger.info(f"Successfully updated radiologist {email} (uId: {u_id}) with oldUserId: {old_user_id}")
-                self.stats['updated'] += 1
-                return True
-            else:
-                logger.error(f"No rows updated for radiologist {email} (uId: {u_id}) - check if userType or uId mismatch")
-                self.stats['errors'] += 1
-                return False
+            # Every uId came from the RADIOLOGIST lookup, so each update hits a row
+            self.stats['updated'] += len(updates)
         except Exception as e:
-            logger.error(f"Error updating radiologist {email} with oldUserId {old_user_id}: {e}")
-            self.stats['errors'] += 1
-            return False
+            logger.error(f"Error updating radiologists with oldUserId: {e}")
+            self.stats['errors'] += len(updates)
+            raise
 
     def fetch_radiologists_from_mysql(self):
-        """Fetch all radiologists from MySQL tbl_radiologist table"""
+        """Stream radiologists from MySQL tbl_radiologist table in FETCH_SIZE chunks"""
+        fetched = 0
         try:
-            cursor = self.mysql_conn.cursor(dictionary=True)
+            cursor = self.mysql_conn.cursor(dictionary=True, buffered=False)
             
             query = """
                 SELECT 
@@ -180,27 +156,20 @@ class RadiologistToUsersDataUpdater:
             """
             
             cursor.execute(query)
-            radiologists = cursor.fetchall()
+            while True:
+                rows = cursor.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                fetched += len(rows)
+                yield from rows
             cursor.close()
             
-            logger.info(f"Fetched {len(radiologists)} radiologists from MySQL")
-            return radiologists
+            logger.info(f"Fetched {fetched} radiologists from MySQL")
             
         except Exception as e:
+            # Re-raise so run_update() rolls back instead of committing a partial set
             logger.error(f"Error fetching radiologists from MySQL: {e}")
-            return []
-
-    def get_postgres_radiologist_count(self):
-        """Get count of radiologists in PostgreSQL Users table"""
-        try:
-            cursor = self.postgres_conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM "Users" WHERE "userType" = \'RADIOLOGIST\'')
-            count = cursor.fetchone()[0]
-            cursor.close()
-            return count
-        except Exception as e:
-            logger.error(f"Error getting PostgreSQL radiologist count: {e}")
-            return 0
+            raise
 
     def run_update(self):
         """Execute the complete update process"""
@@ -208,17 +177,15 @@ class RadiologistToUsersDataUpdater:
             logger.info("Starting tbl_radiologist oldUserId update process")
             # Connect to databases
             self.connect_databases()
-            # Get counts for statistics
-            self.stats['total_postgres_radiologists'] = self.get_postgres_radiologist_count()
+            # Load PostgreSQL radiologists once; matching is done in memory
+            self.stats['total_postgres_radiologists'] = self.load_postgres_radiologists()
             logger.info(f"Found {self.stats['total_postgres_radiologists']} radiologists in PostgreSQL Users table")
             # Fetch radiologists from MySQL
-            radiologists = self.fetch_radiologists_from_mysql()
-            self.stats['total_mysql_records'] = len(radiologists)
-            if not radiologists:
-                logger.warning("No radiologists found in MySQL database")
-                return
-            # Process each radiologist
-            for radiologist in radiologists:
+            # Process each radiologist as it streams in
+            # uId -> oldUserId; later MySQL rows win, as with sequential updates
+            updates = {}
+            for radiologist in self.fetch_radiologists_from_mysql():
+                self.stats['total_mysql_records'] += 1
                 email = radiologist['email']
                 old_user_id = radiologist['radiologist_id']
                 fname = radiologist.get('fname', '')
@@ -227,11 +194,14 @@ class RadiologistToUsersDataUpdater:
                 match = self.find_radiologist_by_email_or_name(email, fname, lname)
                 if match:
                     u_id, prev_old_user_id = match
-                    logger.info(f"Updating oldUserId for uId: {u_id} from {prev_old_user_id} to {old_user_id}")
-                    self.update_radiologist_old_id(u_id, old_user_id, email)
-                    # Commit after each successful update
-                    self.postgres_conn.commit()
-            # Final commit
+                    logger.debug("Updating oldUserId for uId: %s from %s to %s", u_id, prev_old_user_id, old_user_id)
+                    updates[u_id] = old_user_id
+            if not self.stats['total_mysql_records']:
+                logger.warning("No radiologists found in MySQL database")
+                return
+            if updates:
+                self.update_radiologist_old_ids(updates)
+            # Single commit for the whole batch
             self.postgres_conn.commit()
             # Print update statistics
             logger.info("Update process completed!")
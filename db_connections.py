@@ -3,12 +3,21 @@ import colorama
 from colorama import Fore, Style
 import mysql.connector
 import psycopg2
+import psycopg2.pool
 import os
 
 colorama.init(autoreset=True) 
 
 load_dotenv()
 
+# ---------------- Connection Pools ---------------- #
+# PostgreSQL pools are created lazily on first use and live for the whole process,
+# so connections released with put_postgres_connection() are reused within a script.
+POOL_MAX_CONNECTIONS = 8
+
+_postgres_pools = {}  # keyed by database name (postgres.py switches databases)
+_postgres_conn_pools = {}  # checked-out connection -> pool it came from
+
 # ---------------- MySQL Connection ---------------- #
 def get_mysql_connection():
     return mysql.connector.connect(
@@ -20,7 +29,33 @@ def get_mysql_connection():
 
 # ---------------- PostgreSQL Connection ---------------- #
 def get_postgres_connection():
-    return psycopg2.connect(
+    # Release with put_postgres_connection() instead of close()
+    dbname = os.getenv("POSTGRES_DATABASE")
+    if dbname not in _postgres_pools:
+        _postgres_pools[dbname] = create_postgres_pool(1, POOL_MAX_CONNECTIONS)
+    conn = _postgres_pools[dbname].getconn()
+    _postgres_conn_pools[conn] = _postgres_pools[dbname]
+    return conn
+
+def put_postgres_connection(conn):
+    # Return a connection from get_postgres_connection() to its pool;
+    # an open transaction is rolled back by the pool
+    pool = _postgres_conn_pools.pop(conn, None)
+    if pool is None:
+        # Already released, or not from a pool: close it instead of raising,
+        # so nested cleanup paths do not mask the original error
+        if not conn.closed:
+            conn.close()
+        return
+    if not conn.closed and conn.autocommit:
+        conn.autocommit = False
+    pool.putconn(conn)
+
+# ---------------- PostgreSQL Connection Pool ---------------- #
+def create_postgres_pool(minconn, maxconn):
+    return psycopg2.pool.ThreadedConnectionPool(
+        minconn,
+        maxconn,
         host=os.getenv("POSTGRES_HOST"),
         user=os.getenv("POSTGRES_USER"),
         password=os.getenv("POSTGRES_PASSWORD"),
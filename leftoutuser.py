@@ -4,6 +4,7 @@ Script to find users from the old database that are missing in the new database.
 This helps identify which users need to be added to the new database before migration.
 """
 
+import csv
 import mysql.connector
 import psycopg2
 import logging
@@ -13,7 +14,7 @@ import sys
 
 # Add the parent directory to Python path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_connections import get_mysql_connection, get_postgres_connection
+from db_connections import get_mysql_connection, get_postgres_connection, put_postgres_connection
 
 # Setup logging
 def setup_logging():
@@ -40,154 +41,150 @@ def setup_logging():
     logger.info(f"Logging initialized. Log file: {log_filename}")
     return logger
 
+FETCH_SIZE = 10000  # rows per round trip when streaming ids
+DETAIL_CHUNK_SIZE = 1000  # ids per IN (...) when hydrating missing users
+REPORT_BUFFER_SIZE = 1 << 20  # 1 MiB write buffer for the report files
+
 def get_old_database_users():
-    """Get all user IDs from the old MySQL database"""
+    """Get all user IDs from the old MySQL database as (tbl_users ids, tbl_radiologist ids)"""
     logger = logging.getLogger(__name__)
-    logger.info("Fetching users from old MySQL database...")
+    logger.info("Fetching user IDs from old MySQL database...")
     
     try:
         mysql_conn = get_mysql_connection()
-        mysql_cursor = mysql_conn.cursor(dictionary=True)
-        
-        # Get users from tbl_users
-        mysql_cursor.execute("""
-            SELECT user_id, fname, lname, email, title, status, add_time
-            FROM tbl_users 
-            WHERE user_id IS NOT NULL
-            ORDER BY user_id
-        """)
-        tbl_users = mysql_cursor.fetchall()
-        logger.info(f"Found {len(tbl_users)} users in tbl_users")
-        
-        # Get radiologists from tbl_radiologist
-        mysql_cursor.execute("""
-            SELECT radiologist_id, fname, lname, email, status, add_time
-            FROM tbl_radiologist 
-            WHERE radiologist_id IS NOT NULL
-            ORDER BY radiologist_id
-        """)
-        tbl_radiologists = mysql_cursor.fetchall()
-        logger.info(f"Found {len(tbl_radiologists)} radiologists in tbl_radiologist")
-        
-        # Combine all users from old database
-        old_users = {}
+        mysql_cursor = mysql_conn.cursor(buffered=False)
         
-        # Add tbl_users
-        for user in tbl_users:
-            user_id = user['user_id']
-            old_users[user_id] = {
-                'id': user_id,
-                'fname': user['fname'],
-                'lname': user['lname'],
-                'email': user['email'],
-                'title': user['title'],
-                'status': user['status'],
-                'add_time': user['add_time'],
-                'source_table': 'tbl_users',
-                'user_type': 'CLINIC_USERS'
-            }
+        # Only the ids are needed to find the missing users
+        mysql_cursor.execute("SELECT user_id FROM tbl_users WHERE user_id IS NOT NULL")
+        user_ids = {row[0] for row in mysql_cursor}
+        logger.info(f"Found {len(user_ids)} users in tbl_users")
         
-        # Add tbl_radiologists
-        for radiologist in tbl_radiologists:
-            radiologist_id = radiologist['radiologist_id']
-            old_users[radiologist_id] = {
-                'id': radiologist_id,
-                'fname': radiologist['fname'],
-                'lname': radiologist['lname'],
-                'email': radiologist['email'],
-                'title': None,
-                'status': radiologist['status'],
-                'add_time': radiologist['add_time'],
-                'source_table': 'tbl_radiologist',
-                'user_type': 'RADIOLOGIST'
-            }
+        mysql_cursor.execute("SELECT radiologist_id FROM tbl_radiologist WHERE radiologist_id IS NOT NULL")
+        radiologist_ids = {row[0] for row in mysql_cursor}
+        logger.info(f"Found {len(radiologist_ids)} radiologists in tbl_radiologist")
         
         mysql_cursor.close()
         mysql_conn.close()
         
-        logger.info(f"Total unique users in old database: {len(old_users)}")
-        return old_users
+        logger.info(f"Total unique users in old database: {len(user_ids | radiologist_ids)}")
+        return user_ids, radiologist_ids
         
     except Exception as e:
         logger.error(f"Error fetching users from MySQL: {str(e)}")
         raise
 
 def get_new_database_users():
-    """Get all user IDs from the new PostgreSQL database"""
+    """Get the set of olduserid values already present in the new PostgreSQL database"""
     logger = logging.getLogger(__name__)
-    logger.info("Fetching users from new PostgreSQL database...")
+    logger.info("Fetching olduserids from new PostgreSQL database...")
     
     try:
         postgres_conn = get_postgres_connection()
-        postgres_cursor = postgres_conn.cursor()
+        # Server-side cursor so "Users" is pulled in itersize chunks
+        postgres_cursor = postgres_conn.cursor(name='users_stream')
+        postgres_cursor.itersize = FETCH_SIZE
         
-        # Get all users with their olduserid if available
         postgres_cursor.execute("""
-            SELECT "uId", "olduserid", "firstName", "lastName", "email", "userType", "createdAt"
+            SELECT "olduserid"
             FROM "Users" 
-            ORDER BY "uId"
+            WHERE "olduserid" IS NOT NULL
         """)
-        
-        new_users = {}
-        for row in postgres_cursor.fetchall():
-            u_id, old_user_id, first_name, last_name, email, user_type, created_at = row
-            new_users[u_id] = {
-                'uId': u_id,
-                'olduserid': old_user_id,
-                'firstName': first_name,
-                'lastName': last_name,
-                'email': email,
-                'userType': user_type,
-                'createdAt': created_at
-            }
+        new_olduserids = {row[0] for row in postgres_cursor}
         
         postgres_cursor.close()
-        postgres_conn.close()
-        
-        logger.info(f"Total users in new database: {len(new_users)}")
+        put_postgres_connection(postgres_conn)
         
-        # Count users with olduserid
-        users_with_old_id = sum(1 for user in new_users.values() if user['olduserid'] is not None)
-        logger.info(f"Users with olduserid: {users_with_old_id}")
+        logger.info(f"Users with olduserid: {len(new_olduserids)}")
         
-        return new_users
+        return new_olduserids
         
     except Exception as e:
         logger.error(f"Error fetching users from PostgreSQL: {str(e)}")
         raise
 
-def find_missing_users(old_users, new_users):
-    """Find users from old database that are missing in new database"""
+def fetch_missing_user_details(missing_user_ids, missing_radiologist_ids):
+    """Load report details from MySQL for the missing ids only"""
     logger = logging.getLogger(__name__)
-    logger.info("Comparing users between old and new databases...")
-    
-    # Get all old user IDs
-    old_user_ids = set(old_users.keys())
+    missing_users = []
     
-    # Get all new user IDs (both uId and olduserid)
-    new_user_ids = set()
-    new_olduserids = set()
+    mysql_conn = get_mysql_connection()
+    try:
+        mysql_cursor = mysql_conn.cursor(dictionary=True)
+        
+        user_ids = sorted(missing_user_ids)
+        for i in range(0, len(user_ids), DETAIL_CHUNK_SIZE):
+            chunk = user_ids[i:i + DETAIL_CHUNK_SIZE]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            mysql_cursor.execute(f"""
+                SELECT user_id, fname, lname, email, title, status, add_time
+                FROM tbl_users 
+                WHERE user_id IN ({placeholders})
+                ORDER BY user_id
+            """, chunk)
+            for user in mysql_cursor.fetchall():
+                missing_users.append({
+                    'id': user['user_id'],
+                    'fname': user['fname'],
+                    'lname': user['lname'],
+                    'email': user['email'],
+                    'title': user['title'],
+                    'status': user['status'],
+                    'add_time': user['add_time'],
+                    'source_table': 'tbl_users',
+                    'user_type': 'CLINIC_USERS'
+                })
+        
+        radiologist_ids = sorted(missing_radiologist_ids)
+        for i in range(0, len(radiologist_ids), DETAIL_CHUNK_SIZE):
+            chunk = radiologist_ids[i:i + DETAIL_CHUNK_SIZE]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            mysql_cursor.execute(f"""
+                SELECT radiologist_id, fname, lname, email, status, add_time
+                FROM tbl_radiologist 
+                WHERE radiologist_id IN ({placeholders})
+                ORDER BY radiologist_id
+            """, chunk)
+            for radiologist in mysql_cursor.fetchall():
+                missing_users.append({
+                    'id': radiologist['radiologist_id'],
+                    'fname': radiologist['fname'],
+                    'lname': radiologist['lname'],
+                    'email': radiologist['email'],
+                    'title': None,
+                    'status': radiologist['status'],
+                    'add_time': radiologist['add_time'],
+                    'source_table': 'tbl_radiologist',
+                    'user_type': 'RADIOLOGIST'
+                })
+        
+        mysql_cursor.close()
+    finally:
+        mysql_conn.close()
     
-    for user in new_users.values():
-        new_user_ids.add(user['uId'])
-        if user['olduserid'] is not None:
-            new_olduserids.add(user['olduserid'])
+    logger.info(f"Loaded details for {len(missing_users)} missing users")
+    return missing_users
+
+def find_missing_users(old_user_ids, old_radiologist_ids, new_olduserids):
+    """Find users from old database that are missing in new database"""
+    logger = logging.getLogger(__name__)
+    logger.info("Comparing users between old and new databases...")
     
-    logger.info(f"Old database user IDs: {len(old_user_ids)}")
-    logger.info(f"New database uIds: {len(new_user_ids)}")
+    old_ids = old_user_ids | old_radiologist_ids
+    logger.info(f"Old database user IDs: {len(old_ids)}")
     logger.info(f"New database olduserids: {len(new_olduserids)}")
     
     # Find missing users (users in old database but not in new database)
-    missing_user_ids = old_user_ids - new_olduserids
+    missing_ids = old_ids - new_olduserids
     
-    logger.info(f"Missing users: {len(missing_user_ids)}")
+    logger.info(f"Missing users: {len(missing_ids)}")
     
-    # Get details of missing users
-    missing_users = []
-    for user_id in missing_user_ids:
-        missing_users.append(old_users[user_id])
+    if not missing_ids:
+        return []
     
-    return missing_users
+    # An id in both tables is reported as the radiologist
+    missing_radiologist_ids = missing_ids & old_radiologist_ids
+    missing_user_ids = missing_ids - missing_radiologist_ids
+    return fetch_missing_user_details(missing_user_ids, missing_radiologist_ids)
 
 def generate_missing_users_report(missing_users):
     """Generate a detailed report of missing users"""
@@ -220,7 +217,7 @@ def generate_missing_users_report(missing_users):
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     summary_file = os.path.join(script_dir, f"missing_users_summary_{timestamp}.txt")
     
-    with open(summary_file, 'w') as f:
+    with open(summary_file, 'w', encoding='utf-8', buffering=REPORT_BUFFER_SIZE) as f:
         f.write(f"Missing Users Report - Generated on {datetime.now()}\n")
         f.write("=" * 80 + "\n\n")
         f.write(f"Total missing users: {len(missing_users)}\n\n")
@@ -229,18 +226,24 @@ def generate_missing_users_report(missing_users):
             f.write(f"Missing users from {source_table} ({len(users)} users):\n")
             f.write("-" * 60 + "\n")
             
-            for user in users:
-                f.write(f"ID: {user['id']:>6} | {user['fname']} {user['lname']} | {user['email']} | Type: {user['user_type']}\n")
+            f.writelines(
+                f"ID: {user['id']:>6} | {user['fname']} {user['lname']} | {user['email']} | Type: {user['user_type']}\n"
+                for user in users
+            )
             f.write("\n")
     
     logger.info(f"\n📄 Detailed report saved to: {summary_file}")
     
     # Also create a CSV file for easy import
     csv_file = os.path.join(script_dir, f"missing_users_{timestamp}.csv")
-    with open(csv_file, 'w') as f:
-        f.write("ID,FirstName,LastName,Email,Title,Status,AddTime,SourceTable,UserType\n")
-        for user in missing_users:
-            f.write(f"{user['id']},{user['fname']},{user['lname']},{user['email']},{user['title'] or ''},{user['status']},{user['add_time']},{user['source_table']},{user['user_type']}\n")
+    with open(csv_file, 'w', newline='', encoding='utf-8', buffering=REPORT_BUFFER_SIZE) as f:
+        writer = csv.writer(f)
+        writer.writerow(["ID", "FirstName", "LastName", "Email", "Title", "Status", "AddTime", "SourceTable", "UserType"])
+        writer.writerows(
+            (user['id'], user['fname'], user['lname'], user['email'], user['title'] or '',
+             user['status'], user['add_time'], user['source_table'], user['user_type'])
+            for user in missing_users
+        )
     
     logger.info(f"📊 CSV export saved to: {csv_file}")
 
@@ -251,14 +254,14 @@ def main():
     try:
         logger.info("🔍 Starting missing users analysis...")
         
-        # Get users from old database
-        old_users = get_old_database_users()
+        # Get user ids from old database
+        old_user_ids, old_radiologist_ids = get_old_database_users()
         
-        # Get users from new database
-        new_users = get_new_database_users()
+        # Get olduserids from new database
+        new_olduserids = get_new_database_users()
         
         # Find missing users
-        missing_users = find_missing_users(old_users, new_users)
+        missing_users = find_missing_users(old_user_ids, old_radiologist_ids, new_olduserids)
         
         # Generate report
         generate_missing_users_report(missing_users)
@@ -1,21 +1,135 @@
-from Users.migrate import get_numbered_scripts as get_users_scripts, run_scripts as run_users_scripts
-from Invoices.migrate import get_numbered_scripts as get_invoices_scripts, run_scripts as run_invoices_scripts
-from Cases.migrate import get_numbered_scripts as get_cases_scripts, run_scripts as run_cases_scripts
+import os
+import queue
+import logging
+import logging.handlers
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-def main():
+from Users.migrate import get_numbered_scripts as get_users_scripts
+from Invoices.migrate import get_numbered_scripts as get_invoices_scripts
+from Cases.migrate import get_numbered_scripts as get_cases_scripts
+
+MAX_PARALLEL_SCRIPTS = 4  # each script is its own process with its own DB connections
+
+# Output from concurrently running scripts goes through one queue, and a single
+# listener thread writes it, so lines from different scripts never interleave
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(message)s',
+    handlers=[logging.handlers.QueueHandler(queue.Queue())]
+)
+logger = logging.getLogger(__name__)
+
+USERS = [("Users", 1), ("Users", 2)]
+
+# (group, script number) -> scripts that must finish first.
+# Every invoice and case script maps owners through "Users".olduserid.
+DEPENDENCIES = {
     # USERS:- Total 2 tables
-    user_scripts = get_users_scripts()
-    run_users_scripts(user_scripts)
+    ("Users", 1): [],
+    ("Users", 2): [("Users", 1)],
 
     # INVOICES:- Total 4 tables
-    invoice_scripts = get_invoices_scripts()
-    run_invoices_scripts(invoice_scripts)
+    ("Invoices", 1): USERS,
+    ("Invoices", 2): USERS + [("Invoices", 1), ("Cases", 1)],  # reads "Cases"
+    ("Invoices", 3): USERS,
+    ("Invoices", 4): USERS + [("Invoices", 3), ("Cases", 1)],  # validates "caseId" against "Cases"
+    ("Invoices", 5): USERS,
 
     # CASES:- Total 6 tables
-    case_scripts = get_cases_scripts()
-    run_cases_scripts(case_scripts)
+    ("Cases", 1): USERS + [("Invoices", 1), ("Invoices", 3)],  # fills "Cases"."invoiceId"
+    ("Cases", 2): USERS + [("Cases", 1)],
+    ("Cases", 3): USERS + [("Cases", 1)],
+    ("Cases", 4): USERS + [("Cases", 1)],
+    ("Cases", 5): USERS + [("Cases", 1)],
 
     # PAYMENTS:- Total  tables
+}
+
+def get_all_scripts():
+    """Return {(group, number): script path} for every numbered script"""
+    root_dir = os.path.dirname(os.path.abspath(__file__))
+    scripts = {}
+    for group, get_scripts in (("Users", get_users_scripts),
+                               ("Invoices", get_invoices_scripts),
+                               ("Cases", get_cases_scripts)):
+        for script in get_scripts():
+            number = int(script.split("_", 1)[0])
+            scripts[(group, number)] = os.path.join(root_dir, group, script)
+    return scripts
+
+def run_script(script_path):
+    script = os.path.basename(script_path)
+    logger.info(f"🚀 Running {script}...")
+    # -u: a child writing to a pipe would otherwise block-buffer its output
+    process = subprocess.Popen(
+        [sys.executable, "-u", script_path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True
+    )
+    # Prefix each child line with e.g. "Cases/1" so parallel output stays readable
+    label = f"{os.path.basename(os.path.dirname(script_path))}/{script.split('_', 1)[0]}"
+    for line in process.stdout:
+        logger.info("[%s] %s", label, line.rstrip())
+    return process.wait()
+
+def main():
+    listener = logging.handlers.QueueListener(logging.getLogger().handlers[0].queue, logging.StreamHandler())
+    listener.start()
+    try:
+        run_all()
+    finally:
+        listener.stop()
+
+def run_all():
+    scripts = get_all_scripts()
+
+    # Fail before anything runs if a script named in DEPENDENCIES is missing
+    missing = [f"{group}/{number}" for group, number in DEPENDENCIES if (group, number) not in scripts]
+    if missing:
+        logger.error(f"❌ Scripts listed in DEPENDENCIES not found: {missing}")
+        sys.exit(1)
+
+    # Scripts without an entry wait for every listed one
+    dependencies = {key: [dep for dep in DEPENDENCIES.get(key, list(DEPENDENCIES)) if dep != key]
+                    for key in scripts}
+
+    completed = set()
+    running = {}
+    failed = False
+
+    # Threads only wait on child processes, so a thread pool is enough here
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_SCRIPTS) as executor:
+        while True:
+            if not failed:
+                for key in sorted(scripts):
+                    if key in completed or key in running.values():
+                        continue
+                    if all(dep in completed for dep in dependencies[key]):
+                        running[executor.submit(run_script, scripts[key])] = key
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                script = os.path.basename(scripts[key])
+                returncode = future.result()
+                if returncode != 0:
+                    logger.error(f"❌ {script} exited with error code {returncode}")
+                    # Let running scripts finish, but start nothing new
+                    failed = True
+                else:
+                    logger.info(f"✅ {script} completed successfully.")
+                    completed.add(key)
+
+    if failed or len(completed) != len(scripts):
+        skipped = [os.path.basename(scripts[key]) for key in sorted(scripts) if key not in completed]
+        logger.warning(f"⚠️ Not completed: {skipped}")
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
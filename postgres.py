@@ -3,71 +3,182 @@
 import subprocess
 import sys
 from psycopg2 import connect, sql, errors
-from db_connections import get_postgres_connection
+from db_connections import get_postgres_connection, put_postgres_connection
 import os
-import shutil
 
 # CONFIGS
 NEW_DB_NAME = "website_db_order2"
+# Custom-format file (pg_dump -Fc) or directory-format dump. A directory dump made with
+# pg_dump -Fd -j N -Z 6 -f <dir> lets every pg_restore pass read tables in parallel.
 BACKUP_FILE = "/home/eternal/Desktop/voxel_order_1/Backup/dev_voxel_app_db.backup"
-TEMP_BACKUP_FILE = "/tmp/dev_voxel_app_db.backup"
 POSTGRES_BIN_PATH = "/usr/lib/postgresql/16/bin"  # Change this if using a different version
+RESTORED_MARKER = "restored"  # database comment set once every pg_restore pass succeeded
+RESTORE_JOBS = min(os.cpu_count() or 1, 8)  # parallel pg_restore workers; keep below max_connections
+RESTORE_DATA_JOBS = min(RESTORE_JOBS, 2)  # table data is disk-bound; more workers only contend for I/O
+
+# pg_restore sections in order, with the workers each gets: schema objects
+# serially, table data at disk parallelism, then indexes/constraints on all cores
+RESTORE_SECTIONS = [
+    ("pre-data", 1),
+    ("data", RESTORE_DATA_JOBS),
+    ("post-data", RESTORE_JOBS),
+]
+
+# Server settings relaxed while the restore runs (all reloadable, no restart needed).
+# fsync/full_page_writes off trades crash safety for speed; they are reset afterwards.
+RESTORE_SERVER_SETTINGS = {
+    "fsync": "off",
+    "full_page_writes": "off",
+    "autovacuum": "off",
+    "maintenance_work_mem": "1GB",
+    "max_wal_size": "8GB",
+}
+
+def has_postgres_acl(path):
+    """Return True if path already carries an ACL entry for the postgres user"""
+    result = subprocess.run(["sudo", "getfacl", "-c", "-p", path], capture_output=True, text=True, check=True)
+    return any(line.startswith("user:postgres:") for line in result.stdout.splitlines())
+
 
 def prepare_backup_file():
-    """Copy backup file to a location accessible by postgres user"""
+    """
+    Grant the postgres user read access to the backup file or dump directory in place (no copy).
+    Returns the (path, recursive) ACL entries it added, for revoke_backup_file_access.
+    """
     print(f"Preparing backup file for postgres access...")
+    granted = []
     try:
-        # Copy to /tmp
-        shutil.copy2(BACKUP_FILE, TEMP_BACKUP_FILE)
-        
-        # Change ownership to postgres user
-        subprocess.run(
-            ["sudo", "chown", "postgres:postgres", TEMP_BACKUP_FILE],
-            check=True
-        )
-        print(f"✅ Backup file prepared at {TEMP_BACKUP_FILE}")
+        recursive = os.path.isdir(BACKUP_FILE)
+        if not has_postgres_acl(BACKUP_FILE):
+            if recursive:
+                # Directory dump: read on every file, traverse on the directory itself
+                acl_command = ["sudo", "setfacl", "-R", "-m", "u:postgres:rX", BACKUP_FILE]
+            else:
+                acl_command = ["sudo", "setfacl", "-m", "u:postgres:r", BACKUP_FILE]
+            subprocess.run(acl_command, check=True)
+            granted.append((BACKUP_FILE, recursive))
+        # postgres also needs to traverse every parent directory; entries that
+        # were already there are left alone and not removed afterwards
+        directory = os.path.dirname(os.path.abspath(BACKUP_FILE))
+        while directory != os.path.dirname(directory):
+            if not has_postgres_acl(directory):
+                subprocess.run(
+                    ["sudo", "setfacl", "-m", "u:postgres:x", directory],
+                    check=True
+                )
+                granted.append((directory, False))
+            directory = os.path.dirname(directory)
+        print(f"✅ Backup file readable by postgres at {BACKUP_FILE}")
+        return granted
     except Exception as e:
         print(f"❌ Error preparing backup file: {e}")
+        revoke_backup_file_access(granted)
+        sys.exit(1)
+
+
+def revoke_backup_file_access(granted):
+    """Remove the postgres ACL entries added by prepare_backup_file"""
+    if not granted:
+        return
+    print("Removing postgres access to the backup file...")
+    for path, recursive in reversed(granted):
+        try:
+            subprocess.run(
+                ["sudo", "setfacl"] + (["-R"] if recursive else []) + ["-x", "u:postgres", path],
+                check=True
+            )
+        except Exception as e:
+            print(f"⚠️  Warning: Could not remove postgres ACL from {path}, run 'setfacl -x u:postgres' manually: {e}")
+    print("✅ Backup file permissions restored.")
+
+def database_ready():
+    """Return True if NEW_DB_NAME exists and was marked restored after all pg_restore passes"""
+    try:
+        os.environ["POSTGRES_DATABASE"] = "postgres"
+        conn = get_postgres_connection()
+        cur = conn.cursor()
+        # A partial restore already has rows in "Users", so only the marker counts
+        cur.execute(
+            "SELECT shobj_description(oid, 'pg_database') FROM pg_database WHERE datname = %s",
+            (NEW_DB_NAME,)
+        )
+        row = cur.fetchone()
+        cur.close()
+        put_postgres_connection(conn)
+        return row is not None and row[0] == RESTORED_MARKER
+    except Exception as e:
+        print(f"❌ Error checking database '{NEW_DB_NAME}': {e}")
         sys.exit(1)
 
-def cleanup_backup_file():
-    """Remove temporary backup file"""
+
+def mark_database_restored():
     try:
-        if os.path.exists(TEMP_BACKUP_FILE):
-            os.remove(TEMP_BACKUP_FILE)
-            print(f"✅ Temporary backup file cleaned up")
+        os.environ["POSTGRES_DATABASE"] = "postgres"
+        conn = get_postgres_connection()
+        conn.autocommit = True
+        cur = conn.cursor()
+
+        cur.execute(sql.SQL("COMMENT ON DATABASE {} IS {}").format(
+            sql.Identifier(NEW_DB_NAME), sql.Literal(RESTORED_MARKER)
+        ))
+
+        cur.close()
+        put_postgres_connection(conn)
     except Exception as e:
-        print(f"⚠️  Warning: Could not clean up temporary file: {e}")
+        print(f"❌ Error marking database as restored: {e}")
+        sys.exit(1)
+
 
 def create_database():
     print(f"Creating database '{NEW_DB_NAME}'...")
     try:
-        subprocess.run(
-            ["sudo", "-u", "postgres", f"{POSTGRES_BIN_PATH}/createdb", NEW_DB_NAME],
-            check=True
-        )
+        os.environ["POSTGRES_DATABASE"] = "postgres"
+        conn = get_postgres_connection()
+        conn.autocommit = True  # CREATE DATABASE cannot run inside a transaction
+        cur = conn.cursor()
+
+        cur.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(NEW_DB_NAME)))
+
+        cur.close()
+        put_postgres_connection(conn)
         print(f"✅ Database '{NEW_DB_NAME}' created successfully.")
-    except subprocess.CalledProcessError as e:
+    except errors.DuplicateDatabase:
+        print(f"❌ Error creating database: '{NEW_DB_NAME}' already exists")
+        sys.exit(1)
+    except Exception as e:
         print(f"❌ Error creating database: {e}")
         sys.exit(1)
+    finally:
+        os.environ["POSTGRES_DATABASE"] = "postgres"
 
 
 def restore_backup():
-    print(f"Restoring backup from '{TEMP_BACKUP_FILE}'...")
+    print(f"Restoring backup from '{BACKUP_FILE}'...")
     try:
-        subprocess.run(
-            [
-                "sudo", "-u", "postgres",
-                f"{POSTGRES_BIN_PATH}/pg_restore",
-                "-v",
-                "-d", NEW_DB_NAME,
-                TEMP_BACKUP_FILE
-            ],
-            check=True
-        )
+        for section, jobs in RESTORE_SECTIONS:
+            print(f"Restoring {section} with {jobs} jobs...")
+            subprocess.run(
+                [
+                    "sudo", "-u", "postgres",
+                    f"{POSTGRES_BIN_PATH}/pg_restore",
+                    "--exit-on-error",
+                    f"--section={section}",
+                    "-j", str(jobs),
+                    "-d", NEW_DB_NAME,
+                    BACKUP_FILE
+                ],
+                stderr=subprocess.PIPE,
+                text=True,
+                check=True
+            )
+        # Only a fully restored database (post-data included) gets the marker
+        mark_database_restored()
         print(f"✅ Backup restored successfully into '{NEW_DB_NAME}'.")
     except subprocess.CalledProcessError as e:
         print(f"❌ Error restoring backup: {e}")
+        for line in e.stderr.splitlines():
+            if line.startswith("pg_restore: error:"):
+                print(f"   {line}")
         sys.exit(1)
 
 
@@ -78,25 +189,27 @@ def execute_post_restore_queries():
         conn = get_postgres_connection()
         cur = conn.cursor()
 
-        # DELETE queries
-        delete_queries = [
-            'DELETE FROM "InvoiceCaseServices";',
-            'DELETE FROM "PaymentPlatformAccessTokens";',
-            'DELETE FROM "PaymentTransactions";',
-            'DELETE FROM "CaseFiles";',
-            'DELETE FROM "CaseServices";',
-            'DELETE FROM "CaseStudyPurposes";',
-            'DELETE FROM "CasePatients";',
-            'DELETE FROM "Cases";',
-            'DELETE FROM "RadiologistInvoiceCaseServices";',
-            'DELETE FROM "Invoices";',
-            'DELETE FROM "RadiologistInvoices";'
+        # Tables emptied before migration; one TRUNCATE instead of row-by-row DELETEs.
+        # No CASCADE: if a table outside this list references them, fail instead of emptying it too.
+        truncate_tables = [
+            "InvoiceCaseServices",
+            "PaymentPlatformAccessTokens",
+            "PaymentTransactions",
+            "CaseFiles",
+            "CaseServices",
+            "CaseStudyPurposes",
+            "CasePatients",
+            "Cases",
+            "RadiologistInvoiceCaseServices",
+            "Invoices",
+            "RadiologistInvoices"
         ]
-        for query in delete_queries:
-            cur.execute(query)
+        truncate_query = sql.SQL("TRUNCATE TABLE {};").format(
+            sql.SQL(", ").join(sql.Identifier(table) for table in truncate_tables)
+        )
 
-        # ALTER TABLE if column not exists
-        cur.execute("""
+        # ALTER TABLE if column not exists; enum values added only if missing
+        schema_query = sql.SQL("""
             DO $$
             BEGIN
                 IF NOT EXISTS (
@@ -108,22 +221,16 @@ def execute_post_restore_queries():
                 END IF;
             END
             $$;
+            ALTER TYPE "enum_Users_userType" ADD VALUE IF NOT EXISTS 'CLINIC_USERS';
+            ALTER TYPE "enum_Invoices_invoiceType" ADD VALUE IF NOT EXISTS 'ADHOC';
         """)
 
-        # Enum add safely
-        try:
-            cur.execute("ALTER TYPE \"enum_Users_userType\" ADD VALUE 'CLINIC_USERS';")
-        except errors.DuplicateObject:
-            print("Enum value 'CLINIC_USERS' already exists.")
-
-        try:
-            cur.execute("ALTER TYPE \"enum_Invoices_invoiceType\" ADD VALUE 'ADHOC';")
-        except errors.DuplicateObject:
-            print("Enum value 'ADHOC' already exists.")
+        # Sent as one multi-statement query: a single round trip in one transaction
+        cur.execute(sql.Composed([truncate_query, schema_query]))
 
         conn.commit()
         cur.close()
-        conn.close()
+        put_postgres_connection(conn)
         print("✅ Post-restore SQL steps completed successfully.")
 
     except Exception as e:
@@ -133,6 +240,51 @@ def execute_post_restore_queries():
         os.environ["POSTGRES_DATABASE"] = "postgres"
 
 
+def tune_server_for_restore():
+    print("Relaxing server settings for the restore...")
+    try:
+        os.environ["POSTGRES_DATABASE"] = "postgres"
+        conn = get_postgres_connection()
+        conn.autocommit = True  # ALTER SYSTEM cannot run inside a transaction
+        cur = conn.cursor()
+
+        for name, value in RESTORE_SERVER_SETTINGS.items():
+            cur.execute(sql.SQL("ALTER SYSTEM SET {} = {}").format(sql.Identifier(name), sql.Literal(value)))
+        cur.execute("SELECT pg_reload_conf();")
+
+        cur.close()
+        put_postgres_connection(conn)
+        print(f"✅ Server settings relaxed: {', '.join(RESTORE_SERVER_SETTINGS)}")
+
+    except Exception as e:
+        # Needs superuser; the restore still works without it, only slower
+        print(f"⚠️  Warning: Could not relax server settings: {e}")
+    finally:
+        os.environ["POSTGRES_DATABASE"] = "postgres"
+
+
+def reset_server_settings():
+    print("Resetting server settings...")
+    try:
+        os.environ["POSTGRES_DATABASE"] = "postgres"
+        conn = get_postgres_connection()
+        conn.autocommit = True
+        cur = conn.cursor()
+
+        for name in RESTORE_SERVER_SETTINGS:
+            cur.execute(sql.SQL("ALTER SYSTEM RESET {}").format(sql.Identifier(name)))
+        cur.execute("SELECT pg_reload_conf();")
+
+        cur.close()
+        put_postgres_connection(conn)
+        print("✅ Server settings reset.")
+
+    except Exception as e:
+        print(f"❌ Error resetting server settings, check fsync/full_page_writes manually: {e}")
+    finally:
+        os.environ["POSTGRES_DATABASE"] = "postgres"
+
+
 def delete_database():
     print(f"Dropping database '{NEW_DB_NAME}'...")
     try:
@@ -149,7 +301,7 @@ def delete_database():
         cur.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(NEW_DB_NAME)))
 
         cur.close()
-        conn.close()
+        put_postgres_connection(conn)
         print(f"✅ Database '{NEW_DB_NAME}' dropped successfully.")
 
     except Exception as e:
@@ -165,13 +317,25 @@ if __name__ == "__main__":
     choice = input("Enter your choice: ")
 
     if choice == "1":
-        prepare_backup_file()
-        try:
-            create_database()
-            restore_backup()
-            execute_post_restore_queries()
-        finally:
-            cleanup_backup_file()
+        if database_ready():
+            # Already restored (e.g. a retry): skip the restore, but the cleanup
+            # truncates tables that may already hold migrated data, so ask first
+            print(f"Database '{NEW_DB_NAME}' already restored, skipping create & restore.")
+            confirm = input(f"Run post-restore cleanup (TRUNCATEs Cases, Invoices, ...) on '{NEW_DB_NAME}'? (y/N): ")
+            if confirm.strip().lower() == "y":
+                execute_post_restore_queries()
+            else:
+                print("Post-restore cleanup skipped.")
+        else:
+            granted = prepare_backup_file()
+            tune_server_for_restore()
+            try:
+                create_database()
+                restore_backup()
+                execute_post_restore_queries()
+            finally:
+                reset_server_settings()
+                revoke_backup_file_access(granted)
     elif choice == "2":
         delete_database()
     else: